@@ -4,12 +4,17 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_marshmallow import Marshmallow
 from .config import Config
+from .admission import LimitedFileManager, init_admission
+from .db_routing import RoutingSession, init_db_routing
+from .profiling import ProfiledFileManager, init_profiling
+from .write_behind import init_write_behind
 import logging
 from logging.handlers import RotatingFileHandler
 import os
 
 from .file_systems.hadoop_client import HDFSManager
 from .file_systems.file_client import FileManager
+from .file_systems.s3_client import S3Manager
 
 
 app = Flask(__name__)
@@ -40,35 +45,76 @@ if not os.path.exists(Config.STATIC_DIRECTORY):
     app.logger.info(f'INIT | Created static folder: {Config.STATIC_DIRECTORY}')
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 ma = Marshmallow()
 
-if Config.HADOOP:
+if Config.FILE_SYSTEM == 'hadoop':
     file_manager = HDFSManager(namenode_url=Config.HADOOP_NAMENODE_URL, user=Config.HADOOP_USERNAME)
+elif Config.FILE_SYSTEM == 's3':
+    file_manager = S3Manager(
+        bucket=Config.S3_BUCKET,
+        endpoint_url=Config.S3_ENDPOINT_URL,
+        access_key=Config.S3_ACCESS_KEY_ID,
+        secret_key=Config.S3_SECRET_ACCESS_KEY,
+        region=Config.S3_REGION,
+        multipart_threshold=Config.S3_MULTIPART_THRESHOLD,
+        part_size=Config.S3_PART_SIZE,
+        max_concurrency=Config.S3_MAX_CONCURRENCY,
+        max_pool_connections=Config.S3_MAX_POOL_CONNECTIONS
+    )
 else:
     file_manager = FileManager()
+# Storage calls from every endpoint and worker share the STORAGE_LIMITS slots.
+if Config.WRITE_BEHIND_ENABLED:
+    # Limits on the remote side too, so background replication takes slots like requests do.
+    file_manager = init_write_behind(LimitedFileManager(file_manager), Config)
+    app.logger.info(f'INIT | Write-behind staging enabled, journal: {Config.WRITE_BEHIND_DIRECTORY}')
+file_manager = LimitedFileManager(file_manager)
+if Config.PROFILING_ENABLED:
+    file_manager = ProfiledFileManager(file_manager)
 
 try:
     file_manager.create_directory(path=Config.PARENT_DIRECTORY)
+    file_manager.create_directory(path=Config.CHUNK_DIRECTORY)
 except Exception as e:
-    app.logger.error(f'INIT | Error creating parent folder in file manager: {e}')
+    app.logger.error(f'INIT | Error creating base folders in file manager: {e}')
     raise e
+app.logger.info(f'INIT | Using file system backend: {Config.FILE_SYSTEM}')
 db.init_app(app)
 app.logger.info('INIT | Initialized SQLAlchemy database')
+init_db_routing(app)
+app.logger.info(f'INIT | Read replicas configured: {len(Config.DATABASE_REPLICA_URLS)}')
 ma.init_app(app)
 app.logger.info('INIT | Initialized Marshmallow')
+init_admission(app)
+app.logger.info('INIT | Initialized admission control')
+init_profiling(app, db)
+app.logger.info(f'INIT | Request profiling enabled: {Config.PROFILING_ENABLED}')
 
 from .routes.pdfs import pdf_bp
 from .routes.attachments import attachment_bp
+from .routes.changes import changes_bp
+from .routes.admin import admin_bp
+from .access import init_access_tracking
+from .migrations import upgrade_schema
 
 app.register_blueprint(pdf_bp, url_prefix='/api/pdfs')
 app.logger.info('INIT | Registered blueprint: pdf_bp with prefix /api/pdfs')
 app.register_blueprint(attachment_bp, url_prefix='/api/attachments')
 app.logger.info('INIT | Registered blueprint: attachment_bp with prefix /api/attachments')
+app.register_blueprint(changes_bp, url_prefix='/api/changes')
+app.logger.info('INIT | Registered blueprint: changes_bp with prefix /api/changes')
+app.register_blueprint(admin_bp, url_prefix='/api/admin')
+app.logger.info('INIT | Registered blueprint: admin_bp with prefix /api/admin')
 
 with app.app_context():
     db.create_all()
     app.logger.info('INIT | Created all database tables')
+    upgraded = upgrade_schema(db, app.logger)
+    if upgraded:
+        app.logger.info(f"INIT | Upgraded existing tables, added columns: {', '.join(upgraded)}")
+init_access_tracking(app)
+app.logger.info(f'INIT | Access counters flushed every {Config.ACCESS_FLUSH_SECONDS}s')
 
 from .routes.ui import ui_bp
 app.register_blueprint(ui_bp)
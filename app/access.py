@@ -0,0 +1,93 @@
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime
+
+from . import db
+from .models.access import DocumentAccess
+
+tracker = None
+
+
+class AccessTracker:
+    def __init__(self, app, flush_seconds):
+        """
+        Count document reads in memory and add them to document_access in one upsert per flush,
+        so a download never waits on a database write.
+        :param flush_seconds: Interval between flushes
+        """
+        self.app = app
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._counts = Counter()  # (entity, entity_id) -> reads since the last flush
+        self._last_read = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='access-tracker', daemon=True)
+
+    def record(self, entity, entity_id):
+        key = (entity, entity_id)
+        with self._lock:
+            self._counts[key] += 1
+            self._last_read[key] = datetime.utcnow()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            last_read, self._last_read = self._last_read, {}
+        if not counts:
+            return 0
+        # decayed_at only applies to new rows: their recent reads are as of the read itself.
+        rows = [{'entity': entity, 'entity_id': entity_id, 'reads': reads, 'recent_reads': float(reads),
+                 'last_read_at': last_read[(entity, entity_id)], 'decayed_at': last_read[(entity, entity_id)]}
+                for (entity, entity_id), reads in counts.items()]
+        dialect = db.session.get_bind(mapper=DocumentAccess).dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(DocumentAccess)
+        statement = statement.on_conflict_do_update(
+            index_elements=['entity', 'entity_id'],
+            set_={
+                'reads': DocumentAccess.reads + statement.excluded.reads,
+                'recent_reads': DocumentAccess.recent_reads + statement.excluded.recent_reads,
+                'last_read_at': statement.excluded.last_read_at
+            })
+        try:
+            db.session.execute(statement, rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f"ACCESS | Failed to flush {len(rows)} access counters, keeping them: {e}")
+            with self._lock:
+                self._counts.update(counts)
+                for key, read_at in last_read.items():
+                    self._last_read.setdefault(key, read_at)
+            return 0
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            with self.app.app_context():
+                self.flush()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self.app.app_context():
+            self.flush()
+
+
+def record_access(entity, entity_id):
+    """Count a read of a PDF or attachment; a no-op until init_access_tracking() has run."""
+    if tracker is not None:
+        tracker.record(entity, entity_id)
+
+
+def init_access_tracking(app):
+    global tracker
+    tracker = AccessTracker(app, app.config['ACCESS_FLUSH_SECONDS'])
+    tracker.start()
+    atexit.register(tracker.stop)
@@ -0,0 +1,249 @@
+import mimetypes
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, jsonify, request, send_file
+from werkzeug.http import dump_options_header
+
+# Storage operations grouped by the resource they contend for
+STORAGE_OPERATIONS = {
+    'upload_file': 'storage_write',
+    'write_bytes': 'storage_write',
+    'append_to_file': 'storage_write',
+    'download_file': 'storage_read',
+    'read_bytes': 'storage_read',
+    'read_file': 'storage_read',
+    'create_directory': 'storage_meta',
+    'delete_directory': 'storage_meta',
+    'list_directory': 'storage_meta',
+    'file_status': 'storage_meta',
+    'set_replication': 'storage_meta',
+    'exists': 'storage_meta',
+    'rename': 'storage_meta',
+}
+
+limiters = {}
+bandwidth = None
+_held = threading.local()  # names of the storage limiters the current thread holds a slot of
+
+
+class Overloaded(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"Too many concurrent '{name}' operations, retry after {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Limiter:
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, retry_after):
+        """
+        Bound the number of concurrent operations of one class.
+        :param max_concurrent: Operations allowed to run at once
+        :param max_queue: Operations allowed to wait for a slot; any more are rejected immediately
+        :param queue_timeout: Seconds a queued operation waits before it is rejected
+        :param retry_after: Seconds suggested to rejected callers
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    return False
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.rejected += 1
+                return False
+        with self._lock:
+            self.active += 1
+            self.admitted += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        if not self.acquire():
+            raise Overloaded(self.name, self.retry_after)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected
+            }
+
+
+class BandwidthLimiter:
+    def __init__(self, bytes_per_second, idle_seconds=60):
+        """Per-client token bucket shared by all of a client's concurrent downloads."""
+        self.rate = bytes_per_second
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._buckets = {}  # client -> [tokens, last refill time]
+        self.throttled_seconds = 0.0
+
+    def consume(self, client, size):
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._buckets.setdefault(client, [self.rate, now])
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate) - size
+            bucket[1] = now
+            delay = -bucket[0] / self.rate if bucket[0] < 0 else 0.0
+            self.throttled_seconds += delay
+            for stale in [c for c, (_, last) in self._buckets.items() if now - last > self.idle_seconds]:
+                del self._buckets[stale]
+        if delay:
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'bytes_per_second': self.rate,
+                'clients': len(self._buckets),
+                'throttled_seconds': round(self.throttled_seconds, 3)
+            }
+
+
+class LimitedFileManager:
+    """Wraps a file manager so every storage call takes a slot from its operation class limiter.
+
+    Wrappers may be stacked (the write-behind tier has one on each side): a call made while the
+    thread already holds a slot of the same class does not take a second one."""
+
+    def __init__(self, file_manager):
+        self._file_manager = file_manager
+
+    def __getattr__(self, name):
+        attr = getattr(self._file_manager, name)
+        limiter_name = STORAGE_OPERATIONS.get(name)
+        if limiter_name is None or not callable(attr):
+            return attr
+
+        @wraps(attr)
+        def limited(*args, **kwargs):
+            limiter = limiters.get(limiter_name)
+            held = _held.__dict__.setdefault('names', set())
+            if limiter is None or limiter_name in held:
+                return attr(*args, **kwargs)
+            with limiter.slot():
+                held.add(limiter_name)
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    held.discard(limiter_name)
+        return limited
+
+
+def client_id():
+    return request.headers.get('X-Client-Id') or request.remote_addr or 'unknown'
+
+
+def throttle(blocks, client):
+    """Yield blocks no faster than the per-client download bandwidth allows."""
+    for block in blocks:
+        if bandwidth is not None:
+            bandwidth.consume(client, len(block))
+        yield block
+
+
+def send_throttled_file(path, download_name):
+    """send_file() for downloads, paced by the per-client bandwidth limit when one is configured."""
+    if bandwidth is None:
+        return send_file(path, as_attachment=True, download_name=download_name)
+
+    def blocks():
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(64 * 1024), b''):
+                yield block
+
+    headers = {
+        'Content-Disposition': dump_options_header('attachment', {'filename': download_name}),
+        'Content-Length': str(os.path.getsize(path))
+    }
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    return Response(throttle(blocks(), client_id()), mimetype=mimetype, headers=headers)
+
+
+def admit(name):
+    """Run the view only if a slot of endpoint class `name` is free (or frees up within the queue timeout),
+    otherwise answer 503 with Retry-After. Streamed responses keep the slot until the stream is closed."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            limiter = limiters.get(name)
+            if limiter is None:
+                return view(*args, **kwargs)
+            if not limiter.acquire():
+                raise Overloaded(name, limiter.retry_after)
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                limiter.release()
+                raise
+            response_object = response[0] if isinstance(response, tuple) else response
+            if getattr(response_object, 'is_streamed', False):
+                response_object.call_on_close(limiter.release)
+            else:
+                limiter.release()
+            return response
+        return wrapper
+    return decorator
+
+
+def admission_stats():
+    stats = {name: limiter.stats() for name, limiter in limiters.items()}
+    if bandwidth is not None:
+        stats['download_bandwidth'] = bandwidth.stats()
+    return stats
+
+
+def init_admission(app):
+    global bandwidth
+    for name, limits in {**app.config['ADMISSION_LIMITS'], **app.config['STORAGE_LIMITS']}.items():
+        if limits['concurrency'] > 0:
+            timeout = app.config['STORAGE_QUEUE_TIMEOUT'] if name.startswith('storage_') \
+                else app.config['ADMISSION_QUEUE_TIMEOUT']
+            limiters[name] = Limiter(name, limits['concurrency'], limits['queue'], timeout,
+                                     app.config['ADMISSION_RETRY_AFTER'])
+    if app.config['DOWNLOAD_BANDWIDTH_PER_CLIENT'] > 0:
+        bandwidth = BandwidthLimiter(app.config['DOWNLOAD_BANDWIDTH_PER_CLIENT'])
+
+    @app.errorhandler(Overloaded)
+    def handle_overloaded(e):
+        app.logger.warning(f"ADMISSION | Rejected request to {request.path}: {e}")
+        response = jsonify({'error': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
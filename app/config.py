@@ -1,20 +1,128 @@
 import os
 from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
 
 load_dotenv()
 
+
+def _uses_queue_pool(url):
+    # Flask-SQLAlchemy gives in-memory SQLite a StaticPool, which rejects the QueuePool sizing arguments.
+    url = make_url(url)
+    return not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'))
+
+
+def _engine_options(urls):
+    """
+    Engine options shared by the primary and every replica.
+    :param urls: Database URLs the options are applied to
+    :return: Options for SQLALCHEMY_ENGINE_OPTIONS; pool sizing only when set or every URL pools with a QueuePool
+    """
+    options = {
+        'pool_recycle': int(os.getenv('DATABASE_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() == 'true',
+    }
+    sizing = {
+        'pool_size': ('DATABASE_POOL_SIZE', 10),
+        'max_overflow': ('DATABASE_MAX_OVERFLOW', 20),
+        'pool_timeout': ('DATABASE_POOL_TIMEOUT', 30),
+    }
+    queue_pool = all(_uses_queue_pool(url) for url in urls)
+    for key, (variable, default) in sizing.items():
+        if queue_pool or os.getenv(variable) is not None:
+            options[key] = int(os.getenv(variable, default))
+    return options
+
+
 class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'change-me')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///document_manager.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Comma separated read replica URLs; GET endpoints read from these, everything else uses DATABASE_URL
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options([SQLALCHEMY_DATABASE_URI, *DATABASE_REPLICA_URLS])
+    SQLALCHEMY_BINDS = {f'replica_{i}': url for i, url in enumerate(DATABASE_REPLICA_URLS)}
+    DATABASE_STICKY_SECONDS = int(os.getenv('DATABASE_STICKY_SECONDS', 5))  # read-your-writes window
     PARENT_DIRECTORY = os.getenv('PARENT_DIRECTORY', 'uploads')
     STATIC_DIRECTORY = os.path.join(os.getcwd(), "app", "static")
     TMP_DIRECTORY = os.path.join(os.getcwd(), os.getenv('TMP_DIRECTORY', 'tmp'))
     LOG_DIRECTORY = os.path.join(os.getcwd(), 'logs')
+    CHUNK_DIRECTORY = os.getenv('CHUNK_DIRECTORY', 'chunks')  # content-addressed store for PDF revisions
+    # Every chunk is a file with its own NameNode entry and RPCs, so chunks are kept in the megabyte range
+    CHUNK_MIN_SIZE = int(os.getenv('CHUNK_MIN_SIZE', 256 * 1024))
+    CHUNK_AVG_SIZE = int(os.getenv('CHUNK_AVG_SIZE', 1024 * 1024))  # must be a power of two
+    CHUNK_MAX_SIZE = int(os.getenv('CHUNK_MAX_SIZE', 4 * 1024 * 1024))
+    CHUNK_IO_WORKERS = int(os.getenv('CHUNK_IO_WORKERS', 8))  # parallel chunk writes / read-ahead depth
+    MAX_UNPINNED_VERSIONS = int(os.getenv('MAX_UNPINNED_VERSIONS', 20))  # 0 keeps every version
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50 MB limit
     ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png'}
-    HADOOP = True if os.getenv('FILE_SYSTEM', 'local') == 'hadoop' else False
+    # Admission control: concurrent requests per endpoint class and how many may queue for a slot (0 = no limit)
+    ADMISSION_LIMITS = {
+        name: {'concurrency': int(os.getenv(f'LIMIT_{name.upper()}_CONCURRENCY', concurrency)),
+               'queue': int(os.getenv(f'LIMIT_{name.upper()}_QUEUE', queue))}
+        for name, concurrency, queue in (('upload', 8, 16), ('download', 16, 32), ('metadata', 64, 128),
+                                         ('delete', 8, 16), ('changes', 32, 0))
+    }
+    # Concurrent storage backend calls per operation class, shared by all endpoints and background work
+    STORAGE_LIMITS = {
+        name: {'concurrency': int(os.getenv(f'LIMIT_{name.upper()}_CONCURRENCY', concurrency)),
+               'queue': int(os.getenv(f'LIMIT_{name.upper()}_QUEUE', queue))}
+        for name, concurrency, queue in (('storage_write', 16, 64), ('storage_read', 32, 128),
+                                         ('storage_meta', 32, 128))
+    }
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2))
+    STORAGE_QUEUE_TIMEOUT = float(os.getenv('STORAGE_QUEUE_TIMEOUT', 30))
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 5))
+    DOWNLOAD_BANDWIDTH_PER_CLIENT = int(os.getenv('DOWNLOAD_BANDWIDTH_PER_CLIENT', 0))  # bytes/s, 0 = unlimited
+    # List endpoints stream rows in batches of this size; responses are gzip/brotli compressed when accepted
+    JSON_STREAM_BATCH_SIZE = int(os.getenv('JSON_STREAM_BATCH_SIZE', 1000))
+    BATCH_MAX_IDS = int(os.getenv('BATCH_MAX_IDS', 500))  # ids per batch multi-get request
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+    GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+    BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 4))
+    # Opt-in request profiling: requests with a valid X-Profile-Signature header, or a random sample of them
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_SECRET = os.getenv('PROFILING_SECRET', '')  # HMAC key for signed profiling requests
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))  # fraction of requests, 0 = signed only
+    PROFILING_DIRECTORY = os.path.join(LOG_DIRECTORY, 'profiles')
+    PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 200))
+    # Document reads are counted in memory and flushed to document_access at this interval
+    ACCESS_FLUSH_SECONDS = float(os.getenv('ACCESS_FLUSH_SECONDS', 30))
+    # Tiering policy (python -m app.tools.tiering_policy): replication by read heat, archive for idle documents
+    TIERING_HALF_LIFE_HOURS = float(os.getenv('TIERING_HALF_LIFE_HOURS', 24))  # decay of the recent read count
+    TIERING_HOT_READS = float(os.getenv('TIERING_HOT_READS', 50))
+    TIERING_COLD_AFTER_DAYS = float(os.getenv('TIERING_COLD_AFTER_DAYS', 30))
+    TIERING_ARCHIVE_AFTER_DAYS = float(os.getenv('TIERING_ARCHIVE_AFTER_DAYS', 0))  # 0 = never archive
+    TIERING_ARCHIVE_DIRECTORY = os.getenv('TIERING_ARCHIVE_DIRECTORY', 'archive')
+    TIERING_HOT_REPLICATION = int(os.getenv('TIERING_HOT_REPLICATION', 5))
+    TIERING_DEFAULT_REPLICATION = int(os.getenv('TIERING_DEFAULT_REPLICATION', 3))  # the cluster's dfs.replication
+    TIERING_COLD_REPLICATION = int(os.getenv('TIERING_COLD_REPLICATION', 2))
+    CHANGE_FEED_DEFAULT_LIMIT = int(os.getenv('CHANGE_FEED_DEFAULT_LIMIT', 100))
+    CHANGE_FEED_MAX_LIMIT = int(os.getenv('CHANGE_FEED_MAX_LIMIT', 1000))
+    CHANGE_FEED_MAX_WAIT = float(os.getenv('CHANGE_FEED_MAX_WAIT', 30))  # long-poll cap in seconds
+    CHANGE_FEED_POLL_INTERVAL = float(os.getenv('CHANGE_FEED_POLL_INTERVAL', 0.5))
+    FILE_SYSTEM = os.getenv('FILE_SYSTEM', 'local').lower()  # 'local', 'hadoop' or 's3'
     HADOOP_NAMENODE_URL = os.getenv('HADOOP_NAMENODE_URL', None)
     HADOOP_USERNAME = os.getenv('HADOOP_USERNAME', None)
-    if HADOOP_USERNAME is None or HADOOP_NAMENODE_URL is None:
-        HADOOP = False
+    if FILE_SYSTEM == 'hadoop' and (HADOOP_USERNAME is None or HADOOP_NAMENODE_URL is None):
+        FILE_SYSTEM = 'local'
+    S3_BUCKET = os.getenv('S3_BUCKET', None)
+    S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL', None)
+    S3_ACCESS_KEY_ID = os.getenv('S3_ACCESS_KEY_ID', None)
+    S3_SECRET_ACCESS_KEY = os.getenv('S3_SECRET_ACCESS_KEY', None)
+    S3_REGION = os.getenv('S3_REGION', None)
+    S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+    S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', 8 * 1024 * 1024))
+    S3_MAX_CONCURRENCY = int(os.getenv('S3_MAX_CONCURRENCY', 10))
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv('S3_MAX_POOL_CONNECTIONS', 20))
+    if FILE_SYSTEM == 's3' and S3_BUCKET is None:
+        FILE_SYSTEM = 'local'
+    # Write-behind: acknowledge uploads once journaled on local disk and replicate to HDFS/S3 in the background
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() == 'true' and FILE_SYSTEM != 'local'
+    WRITE_BEHIND_DIRECTORY = os.path.join(os.getcwd(), os.getenv('WRITE_BEHIND_DIRECTORY', 'journal'))
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 32))
+    WRITE_BEHIND_WORKERS = int(os.getenv('WRITE_BEHIND_WORKERS', 4))
+    WRITE_BEHIND_MAX_PENDING_BYTES = int(os.getenv('WRITE_BEHIND_MAX_PENDING_BYTES', 2 * 1024 ** 3))
+    WRITE_BEHIND_MAX_PENDING_ENTRIES = int(os.getenv('WRITE_BEHIND_MAX_PENDING_ENTRIES', 100_000))
+    WRITE_BEHIND_BACKPRESSURE_TIMEOUT = float(os.getenv('WRITE_BEHIND_BACKPRESSURE_TIMEOUT', 10))
+    WRITE_BEHIND_RETRY_MAX_SECONDS = float(os.getenv('WRITE_BEHIND_RETRY_MAX_SECONDS', 60))
+    WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv('WRITE_BEHIND_MAX_ATTEMPTS', 10))  # then dead-lettered, if the remote answers
@@ -0,0 +1,65 @@
+import random
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+STICKY_COOKIE = 'dm_primary'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(Session):
+    """Session that sends reads from endpoints marked with @use_read_replica to a read replica.
+
+    Writes, flushes and anything outside such an endpoint keep using the primary bind."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) and _replica_allowed():
+            if 'db_replica_engine' not in g:
+                # Pick one replica per request so its queries do not observe different replication lag.
+                replicas = [engine for key, engine in self._db.engines.items()
+                            if key is not None and key.startswith('replica_')]
+                g.db_replica_engine = random.choice(replicas) if replicas else None
+            if g.db_replica_engine is not None:
+                return g.db_replica_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _replica_allowed():
+    return has_request_context() and g.get('db_read_replica', False)
+
+
+def use_read_replica(view):
+    """Route the view's queries to a read replica, unless the client wrote recently (read-your-writes)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_replica = _is_read() and STICKY_COOKIE not in request.cookies
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def read_only(view):
+    """Mark a POST endpoint that only reads (e.g. a query too large for a URL) as a read:
+    it may use a read replica and does not pin the client to the primary. Apply above @use_read_replica."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _is_read():
+    return request.method in READ_METHODS or g.get('db_read_only', False)
+
+
+def init_db_routing(app):
+    """Pin a client to the primary for DATABASE_STICKY_SECONDS after any successful write it makes."""
+    sticky_seconds = app.config['DATABASE_STICKY_SECONDS']
+
+    @app.after_request
+    def mark_recent_write(response):
+        if not _is_read() and response.status_code < 400 and sticky_seconds > 0:
+            response.set_cookie(STICKY_COOKIE, str(int(time.time())), max_age=sticky_seconds, httponly=True)
+        return response
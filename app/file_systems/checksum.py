@@ -0,0 +1,10 @@
+import hashlib
+
+
+def sha256_file(path, block_size=1024 * 1024):
+    """Return the hex SHA-256 digest of a local file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
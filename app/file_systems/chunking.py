@@ -0,0 +1,132 @@
+"""
+Content-defined chunking (FastCDC-style gear hash with normalized chunking).
+
+Boundaries depend only on the bytes around them, so a small edit only changes the chunks it
+touches and every other chunk keeps its hash across revisions.
+
+The gear hash at a position only depends on the 64 bytes ending there (older bytes are shifted
+out of the 64-bit hash), so with numpy installed it is computed for a whole block at once in
+log2(64) vectorised steps, outside the GIL. Without numpy a pure-Python loop computes the same
+boundaries, at a few MB/s.
+"""
+import bisect
+import hashlib
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; without it chunking runs the pure-Python loop
+    numpy = None
+
+_MASK_64 = (1 << 64) - 1
+_WINDOW = 64
+# Derived from SHA-256 rather than a seeded RNG so boundaries are stable across Python versions.
+_GEAR = tuple(int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'big') for i in range(256))
+_BLOCK_SIZE = 64 * 1024  # bytes hashed per vectorised step; the uint64 buffers stay in the CPU cache
+
+
+def _mask(bits):
+    # Use the high bits of the rolling hash: they depend on the last 64 bytes, the low bits on far fewer.
+    return ((1 << bits) - 1) << (64 - bits)
+
+
+def _cut_point(data, start, min_size, avg_size, max_size, mask_strict, mask_loose):
+    remaining = len(data) - start
+    if remaining <= min_size:
+        return remaining
+    end = min(remaining, max_size)
+    normal = min(avg_size, end)
+    gear = _GEAR
+    h = 0
+    # Prime the hash with the bytes before the first candidate, so it covers the full window there.
+    for byte in data[start + min_size - _WINDOW + 1:start + min_size]:
+        h = ((h << 1) + gear[byte]) & _MASK_64
+    # Below the target size a stricter mask makes a cut less likely, above it a looser one more likely,
+    # which keeps chunk sizes clustered around avg_size.
+    for i, byte in enumerate(data[start + min_size:start + normal], min_size):
+        h = ((h << 1) + gear[byte]) & _MASK_64
+        if not h & mask_strict:
+            return i + 1
+    for i, byte in enumerate(data[start + normal:start + end], normal):
+        h = ((h << 1) + gear[byte]) & _MASK_64
+        if not h & mask_loose:
+            return i + 1
+    return end
+
+
+def _candidates(data, mask_strict, mask_loose):
+    """Positions whose gear hash passes the loose mask, and the subset passing the strict one (both sorted)."""
+    gear = numpy.array(_GEAR, dtype=numpy.uint64)
+    buffer = numpy.frombuffer(data, dtype=numpy.uint8)
+    size = _BLOCK_SIZE + _WINDOW - 1
+    h, shifted = numpy.empty(size, dtype=numpy.uint64), numpy.empty(size, dtype=numpy.uint64)
+    loose, strict = [], []
+    for block_start in range(0, len(buffer), _BLOCK_SIZE):
+        # Start the window early so the first position of the block sees its full 64 bytes.
+        offset = min(block_start, _WINDOW - 1)
+        block = buffer[block_start - offset:block_start + _BLOCK_SIZE]
+        n = len(block)
+        numpy.take(gear, block, out=h[:n])
+        shift = 1
+        while shift < min(_WINDOW, n):
+            # After this step h[i] sums gear[byte[i - k]] << k for k < 2 * shift.
+            numpy.left_shift(h[:n - shift], numpy.uint64(shift), out=shifted[:n - shift])
+            numpy.add(h[shift:n], shifted[:n - shift], out=h[shift:n])
+            shift *= 2
+        hashes = h[offset:n]
+        hits = numpy.flatnonzero((hashes & numpy.uint64(mask_loose)) == 0)
+        loose.extend((hits + block_start).tolist())
+        strict.extend((hits[(hashes[hits] & numpy.uint64(mask_strict)) == 0] + block_start).tolist())
+    return loose, strict
+
+
+def _first(positions, low, high):
+    index = bisect.bisect_left(positions, low)
+    return positions[index] if index < len(positions) and positions[index] < high else None
+
+
+def _vectorised_lengths(data, min_size, avg_size, max_size, mask_strict, mask_loose):
+    loose, strict = _candidates(data, mask_strict, mask_loose)
+    start = 0
+    while start < len(data):
+        remaining = len(data) - start
+        if remaining <= min_size:
+            yield remaining
+            return
+        end = min(remaining, max_size)
+        normal = min(avg_size, end)
+        cut = _first(strict, start + min_size, start + normal)
+        if cut is None:
+            cut = _first(loose, start + normal, start + end)
+        length = cut + 1 - start if cut is not None else end
+        yield length
+        start += length
+
+
+def _python_lengths(data, min_size, avg_size, max_size, mask_strict, mask_loose):
+    start = 0
+    while start < len(data):
+        length = _cut_point(data, start, min_size, avg_size, max_size, mask_strict, mask_loose)
+        yield length
+        start += length
+
+
+def iter_chunks(data, min_size=256 * 1024, avg_size=1024 * 1024, max_size=4 * 1024 * 1024):
+    """
+    Split bytes into content-defined chunks.
+    :param data: Bytes to split
+    :param min_size: No cut is made before this many bytes; at least 64
+    :param avg_size: Target chunk size; must be a power of two
+    :param max_size: A cut is forced at this many bytes
+    :return: Generator of (sha256 hex digest, chunk bytes)
+    """
+    if min_size < _WINDOW:
+        raise ValueError(f"min_size must be at least {_WINDOW} bytes")
+    bits = avg_size.bit_length() - 1
+    mask_strict, mask_loose = _mask(bits + 1), _mask(bits - 1)
+    lengths = _vectorised_lengths if numpy is not None else _python_lengths
+    view = memoryview(data)
+    start = 0
+    for length in lengths(data, min_size, avg_size, max_size, mask_strict, mask_loose):
+        chunk = bytes(view[start:start + length])
+        yield hashlib.sha256(chunk).hexdigest(), chunk
+        start += length
@@ -1,5 +1,6 @@
 import os
 import shutil
+import threading
 
 from .logger import AppLogger
 
@@ -33,7 +34,10 @@ class FileManager:
         """Delete a directory locally."""
         full_path = self._full_path(path)
         try:
-            if recursive:
+            if os.path.isfile(full_path):
+                os.remove(full_path)
+                self.logger.info(f"Deleted file: {full_path}")
+            elif recursive:
                 shutil.rmtree(full_path, ignore_errors=True)
                 self.logger.info(f"Recursively deleted directory: {full_path}")
             else:
@@ -78,17 +82,64 @@ class FileManager:
             self.logger.error(f"Failed to read file {full_path}: {e}")
             raise e
 
-    def list_directory(self, path):
-        """List files and directories in a given local path."""
+    def read_bytes(self, path):
+        """Read the raw content of a local file."""
         full_path = self._full_path(path)
         try:
-            contents = os.listdir(full_path)
+            with open(full_path, 'rb') as f:
+                content = f.read()
+            self.logger.info(f"Read bytes from file: {full_path}")
+            return content
+        except Exception as e:
+            self.logger.error(f"Failed to read bytes from file {full_path}: {e}")
+            raise
+
+    def write_bytes(self, path, data, overwrite=True):
+        """Write raw content to a local file, creating parent directories as needed."""
+        full_path = self._full_path(path)
+        try:
+            if not overwrite and os.path.exists(full_path):
+                self.logger.warning(f"File {full_path} already exists and overwrite is False.")
+                raise FileExistsError(f"File {full_path} already exists.")
+            os.makedirs(os.path.dirname(full_path) or '.', exist_ok=True)
+            # Write to a temporary name first so readers never see a partially written file
+            tmp_path = f"{full_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, full_path)
+            self.logger.info(f"Wrote {len(data)} bytes to file: {full_path}")
+        except Exception as e:
+            self.logger.error(f"Failed to write bytes to file {full_path}: {e}")
+            raise
+
+    def list_directory(self, path, status=False):
+        """List files and directories in a given local path.
+        With status=True, return (name, status) pairs."""
+        full_path = self._full_path(path)
+        try:
+            if status:
+                with os.scandir(full_path) as entries:
+                    contents = [(entry.name, self._entry_status(entry)) for entry in entries]
+            else:
+                contents = os.listdir(full_path)
             self.logger.info(f"Listed directory: {full_path}")
             return contents
         except Exception as e:
             self.logger.error(f"Failed to list directory {full_path}: {e}")
             raise e
 
+    @staticmethod
+    def _entry_status(entry):
+        stat = entry.stat()
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'ctime': stat.st_ctime,
+            'mode': stat.st_mode,
+            'is_dir': entry.is_dir(),
+            'is_file': entry.is_file()
+        }
+
     def file_status(self, path):
         """Get the status of a file or directory."""
         full_path = self._full_path(path)
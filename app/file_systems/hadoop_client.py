@@ -1,4 +1,5 @@
 from hdfs import InsecureClient
+from hdfs.util import HdfsError
 
 from .logger import AppLogger
 
@@ -61,12 +62,38 @@ class HDFSManager:
             self.logger.error(f"Failed to read file 'hdfs://{storage_path}' from HDFS: {e}")
             raise
 
-    def list_directory(self, path):
-        """List files and directories in a given HDFS path."""
+    def read_bytes(self, storage_path):
+        """Read the raw content of a file from HDFS."""
         try:
-            contents = self.client.list(path)
+            with self.client.read(storage_path) as reader:
+                content = reader.read()
+            self.logger.info(f"Read bytes from HDFS: hdfs://{storage_path}")
+            return content
+        except Exception as e:
+            self.logger.error(f"Failed to read bytes from 'hdfs://{storage_path}': {e}")
+            raise
+
+    def write_bytes(self, storage_path, data, overwrite=True):
+        """Write raw content to a file in HDFS."""
+        try:
+            self.client.write(storage_path, data=data, overwrite=overwrite)
+            self.logger.info(f"Wrote {len(data)} bytes to HDFS: hdfs://{storage_path} (overwrite={overwrite})")
+        except Exception as e:
+            self.logger.error(f"Failed to write bytes to 'hdfs://{storage_path}': {e}")
+            raise
+
+    def list_directory(self, path, status=False):
+        """List files and directories in a given HDFS path.
+        With status=True, return (name, status) pairs from a single LISTSTATUS call."""
+        try:
+            contents = self.client.list(path, status=status)
             self.logger.info(f"Listed directory: hdfs://{path}")
             return contents
+        except HdfsError as e:
+            self.logger.error(f"Failed to list directory 'hdfs://{path}': {e}")
+            if e.exception == 'FileNotFoundException':
+                raise FileNotFoundError(path) from e
+            raise
         except Exception as e:
             self.logger.error(f"Failed to list directory 'hdfs://{path}': {e}")
             raise
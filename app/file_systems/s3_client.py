@@ -0,0 +1,273 @@
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from botocore.exceptions import ClientError
+
+from .logger import AppLogger
+
+
+class S3Manager:
+    def __init__(self, bucket, endpoint_url=None, access_key=None, secret_key=None, region=None,
+                 multipart_threshold=8 * 1024 * 1024, part_size=8 * 1024 * 1024, max_concurrency=10,
+                 max_pool_connections=20):
+        """
+        Initialize the S3 client.
+        :param bucket: Bucket that holds all stored objects
+        :param endpoint_url: Endpoint of an S3-compatible store, e.g., 'http://minio:9000' (optional)
+        :param access_key: Access key id (optional, falls back to the boto3 credential chain)
+        :param secret_key: Secret access key (optional)
+        :param region: Region name (optional)
+        :param multipart_threshold: Size in bytes above which transfers are split into parts
+        :param part_size: Size in bytes of each multipart upload part / ranged download
+        :param max_concurrency: Number of parts transferred in parallel per file
+        :param max_pool_connections: Size of the shared HTTP connection pool
+        """
+        self.bucket = bucket
+        self.region = region
+        self.logger = AppLogger(prefix=" | S3 | ").get_logger()
+        session = boto3.session.Session(
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region
+        )
+        # One pooled client is shared by every request thread and every transfer worker,
+        # so the pool must be at least as large as the transfer concurrency.
+        self.client = session.client(
+            's3',
+            endpoint_url=endpoint_url,
+            config=BotoConfig(
+                max_pool_connections=max(max_pool_connections, max_concurrency),
+                retries={'max_attempts': 5, 'mode': 'standard'}
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=part_size,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+        self._ensure_bucket()
+        self.logger.info(f"S3Manager connected to: {endpoint_url or 'aws'} (bucket={bucket}, "
+                         f"part_size={part_size}, max_concurrency={max_concurrency})")
+
+    def _ensure_bucket(self):
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchBucket'):
+                raise
+            if self.region and self.region != 'us-east-1':
+                self.client.create_bucket(Bucket=self.bucket,
+                                          CreateBucketConfiguration={'LocationConstraint': self.region})
+            else:
+                self.client.create_bucket(Bucket=self.bucket)
+            self.logger.info(f"Created bucket: s3://{self.bucket}")
+
+    @staticmethod
+    def _key(path):
+        return path.strip('/')
+
+    @staticmethod
+    def _prefix(path):
+        key = path.strip('/')
+        return f"{key}/" if key else ""
+
+    def _iter_objects(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def _has_prefix(self, prefix):
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix, MaxKeys=1)
+        return response.get('KeyCount', 0) > 0
+
+    def _delete_keys(self, keys):
+        # DeleteObjects accepts at most 1000 keys per call.
+        for start in range(0, len(keys), 1000):
+            batch = [{'Key': key} for key in keys[start:start + 1000]]
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': batch, 'Quiet': True})
+
+    def create_directory(self, path):
+        """Directories are implicit key prefixes in S3, so there is nothing to create."""
+        self.logger.info(f"Created directory: s3://{self.bucket}/{self._prefix(path)} (implicit)")
+
+    def delete_directory(self, path, recursive=True):
+        """Delete an object or every object under a prefix."""
+        try:
+            keys = []
+            if self._head(self._key(path)) is not None:
+                keys.append(self._key(path))
+            if recursive:
+                keys.extend(obj['Key'] for obj in self._iter_objects(self._prefix(path)))
+            elif self._has_prefix(self._prefix(path)):
+                raise OSError(f"Directory s3://{self.bucket}/{self._prefix(path)} is not empty.")
+            self._delete_keys(keys)
+            self.logger.info(f"Deleted directory: s3://{self.bucket}/{self._key(path)} "
+                             f"(recursive={recursive}, objects={len(keys)})")
+        except Exception as e:
+            self.logger.error(f"Failed to delete directory 's3://{self.bucket}/{self._key(path)}': {e}")
+            raise
+
+    def upload_file(self, local_path, storage_path, overwrite=True):
+        """Upload a local file, using parallel multipart upload for large files."""
+        key = self._key(storage_path)
+        try:
+            if not overwrite and self._head(key) is not None:
+                self.logger.warning(f"Object s3://{self.bucket}/{key} already exists and overwrite is False.")
+                raise FileExistsError(f"Object s3://{self.bucket}/{key} already exists.")
+            self.client.upload_file(local_path, self.bucket, key, Config=self.transfer_config)
+            self.logger.info(f"Uploaded file from '{local_path}' to 's3://{self.bucket}/{key}' (overwrite={overwrite})")
+        except Exception as e:
+            self.logger.error(f"Failed to upload file '{local_path}' to 's3://{self.bucket}/{key}': {e}")
+            raise
+
+    def download_file(self, src_path, local_path, overwrite=True):
+        """Download an object, using parallel ranged GETs for large objects."""
+        key = self._key(src_path)
+        try:
+            self.client.download_file(self.bucket, key, local_path, Config=self.transfer_config)
+            self.logger.info(f"Downloaded file from 's3://{self.bucket}/{key}' to local '{local_path}'")
+        except Exception as e:
+            self.logger.error(f"Failed to download file 's3://{self.bucket}/{key}' to local '{local_path}': {e}")
+            raise
+
+    def read_file(self, storage_path, encoding='utf-8'):
+        """Read the content of an object."""
+        key = self._key(storage_path)
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+            self.logger.info(f"Read file: s3://{self.bucket}/{key}")
+            return body.decode(encoding) if encoding else body
+        except Exception as e:
+            self.logger.error(f"Failed to read file 's3://{self.bucket}/{key}': {e}")
+            raise
+
+    def read_bytes(self, storage_path):
+        """Read the raw content of an object."""
+        return self.read_file(storage_path, encoding=None)
+
+    def write_bytes(self, storage_path, data, overwrite=True):
+        """Write raw content to an object."""
+        key = self._key(storage_path)
+        try:
+            if not overwrite and self._head(key) is not None:
+                self.logger.warning(f"Object s3://{self.bucket}/{key} already exists and overwrite is False.")
+                raise FileExistsError(f"Object s3://{self.bucket}/{key} already exists.")
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+            self.logger.info(f"Wrote {len(data)} bytes to 's3://{self.bucket}/{key}'")
+        except Exception as e:
+            self.logger.error(f"Failed to write bytes to 's3://{self.bucket}/{key}': {e}")
+            raise
+
+    def list_directory(self, path, status=False):
+        """List the objects and sub-prefixes directly under a prefix.
+        With status=True, return (name, status) pairs from the same listing calls."""
+        prefix = self._prefix(path)
+        try:
+            contents = []
+            paginator = self.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+                for p in page.get('CommonPrefixes', []):
+                    name = p['Prefix'][len(prefix):].rstrip('/')
+                    contents.append((name, {'size': 0, 'mtime': None, 'etag': None, 'is_dir': True,
+                                            'is_file': False}) if status else name)
+                for obj in page.get('Contents', []):
+                    name = obj['Key'][len(prefix):]
+                    contents.append((name, {'size': obj['Size'], 'mtime': obj['LastModified'].timestamp(),
+                                            'etag': obj['ETag'].strip('"'), 'is_dir': False,
+                                            'is_file': True}) if status else name)
+            self.logger.info(f"Listed directory: s3://{self.bucket}/{prefix}")
+            return contents
+        except Exception as e:
+            self.logger.error(f"Failed to list directory 's3://{self.bucket}/{prefix}': {e}")
+            raise
+
+    def file_status(self, path):
+        """Get the status of an object or prefix."""
+        key = self._key(path)
+        try:
+            head = self._head(key)
+            if head is not None:
+                status = {
+                    'size': head['ContentLength'],
+                    'mtime': head['LastModified'].timestamp(),
+                    'etag': head['ETag'].strip('"'),
+                    'is_dir': False,
+                    'is_file': True
+                }
+            elif self._has_prefix(self._prefix(path)):
+                status = {'size': 0, 'mtime': None, 'etag': None, 'is_dir': True, 'is_file': False}
+            else:
+                raise FileNotFoundError(f"s3://{self.bucket}/{key} does not exist.")
+            self.logger.info(f"Got file status for: s3://{self.bucket}/{key}")
+            return status
+        except Exception as e:
+            self.logger.error(f"Failed to get file status for 's3://{self.bucket}/{key}': {e}")
+            raise
+
+    def set_replication(self, path, replication):
+        """Set replication factor - not applicable to object storage, so raise error."""
+        self.logger.warning("Attempted to set replication factor on S3 storage (not supported).")
+        raise NotImplementedError("Replication factor is not applicable for S3 objects.")
+
+    def exists(self, path):
+        """Check if an object or prefix exists."""
+        key = self._key(path)
+        try:
+            existence = self._head(key) is not None or self._has_prefix(self._prefix(path))
+            self.logger.info(f"Checked existence for 's3://{self.bucket}/{key}': {existence}")
+            return existence
+        except Exception as e:
+            self.logger.error(f"Failed to check existence for 's3://{self.bucket}/{key}': {e}")
+            raise
+
+    def rename(self, old_path, new_path):
+        """Rename an object or every object under a prefix (server-side copy, then delete)."""
+        old_key, new_key = self._key(old_path), self._key(new_path)
+        try:
+            moves = []
+            if self._head(old_key) is not None:
+                moves.append((old_key, new_key))
+            old_prefix, new_prefix = self._prefix(old_path), self._prefix(new_path)
+            moves.extend((obj['Key'], new_prefix + obj['Key'][len(old_prefix):])
+                         for obj in self._iter_objects(old_prefix))
+            if not moves:
+                raise FileNotFoundError(f"s3://{self.bucket}/{old_key} does not exist.")
+            for src, dst in moves:
+                self.client.copy({'Bucket': self.bucket, 'Key': src}, self.bucket, dst, Config=self.transfer_config)
+            self._delete_keys([src for src, _ in moves])
+            self.logger.info(f"Renamed 's3://{self.bucket}/{old_key}' to 's3://{self.bucket}/{new_key}'")
+        except Exception as e:
+            self.logger.error(f"Failed to rename 's3://{self.bucket}/{old_key}' to 's3://{self.bucket}/{new_key}': {e}")
+            raise
+
+    def append_to_file(self, storage_path, data, encoding='utf-8'):
+        """Append data to an object (objects are immutable, so this rewrites it)."""
+        key = self._key(storage_path)
+        try:
+            existing = b''
+            if self._head(key) is not None:
+                existing = self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=existing + data.encode(encoding))
+            self.logger.info(f"Appended data to file: s3://{self.bucket}/{key}")
+        except Exception as e:
+            self.logger.error(f"Failed to append data to 's3://{self.bucket}/{key}': {e}")
+            raise
+
+
+if __name__ == "__main__":
+    s3_client = S3Manager(bucket='documents', endpoint_url='http://localhost:9000',
+                          access_key='minioadmin', secret_key='minioadmin')
+    s3_client.append_to_file('test_dir/test.txt', "Hello, world!\n")
+    print(s3_client.read_file('test_dir/test.txt'))
+    print(s3_client.list_directory('test_dir'))
+    s3_client.delete_directory('test_dir')
@@ -0,0 +1,32 @@
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """One lock per key, so work on different keys never waits on each other.
+    A key's lock is dropped once no thread holds or waits for it."""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+
+# Serialises uploads of the same document name within this process; across processes the
+# unique name keys and row locks taken by the upload routes do the same job.
+upload_locks = KeyedLocks()
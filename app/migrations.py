@@ -0,0 +1,88 @@
+"""
+In-place upgrade of databases created by an earlier release.
+
+db.create_all() creates missing tables but never alters existing ones. upgrade_schema() adds the
+columns that models gained since their table was created, backfills the ones the code relies
+on (name_key) and creates the unique indexes that create_all() would have created with the table.
+Added columns are nullable in the database; the application always sets the NOT NULL ones.
+"""
+import sqlalchemy as sa
+from sqlalchemy.exc import SQLAlchemyError
+
+from .models.documents import PDF, Attachment, name_key
+
+# Indexes created by create_all() for new tables, added here when their column is added to an old one.
+UNIQUE_INDEXES = {
+    'pdfs.name_key': ('uq_pdfs_name_key', 'pdfs', ('name_key',)),
+    'attachments.name_key': ('uq_attachments_pdf_name_key', 'attachments', ('pdf_id', 'name_key')),
+}
+
+
+def _add_missing_columns(connection, metadata, logger):
+    inspector = sa.inspect(connection)
+    quote = connection.dialect.identifier_preparer.quote
+    added = []
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(sa.text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+            logger.info(f"MIGRATIONS | Added column {table.name}.{column.name} ({column_type})")
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def _backfill_name_keys(connection, model, scope, logger):
+    """Fill name_key from original_filename. A key already taken in its scope (e.g. 'Report.pdf' next
+    to 'report.pdf') gets the row id appended, so the unique index can be created; such documents
+    are only found by id until renamed."""
+    table = model.__table__
+    scope_columns = [table.c[name] for name in scope]
+    taken = {tuple(row) for row in connection.execute(
+        sa.select(*scope_columns, table.c.name_key).where(table.c.name_key.is_not(None)))}
+    updates = []
+    for row in connection.execute(sa.select(table.c.id, table.c.original_filename, *scope_columns)
+                                  .where(table.c.name_key.is_(None)).order_by(table.c.id)):
+        scope_values = tuple(row[2:])
+        key = name_key(row.original_filename)
+        if scope_values + (key,) in taken:
+            logger.warning(f"MIGRATIONS | {table.name} {row.id}: name key '{key}' already taken, "
+                           f"using '{key}#{row.id}'")
+            key = f"{key}#{row.id}"
+        taken.add(scope_values + (key,))
+        updates.append({'row_id': row.id, 'key': key})
+    if updates:
+        connection.execute(table.update().where(table.c.id == sa.bindparam('row_id'))
+                           .values(name_key=sa.bindparam('key')), updates)
+        logger.info(f"MIGRATIONS | Backfilled name_key for {len(updates)} {table.name} rows")
+
+
+def _upgrade(engine, metadata, logger):
+    with engine.begin() as connection:
+        added = _add_missing_columns(connection, metadata, logger)
+        if 'pdfs.name_key' in added:
+            _backfill_name_keys(connection, PDF, (), logger)
+        if 'attachments.name_key' in added:
+            _backfill_name_keys(connection, Attachment, ('pdf_id',), logger)
+        quote = connection.dialect.identifier_preparer.quote
+        for column in added:
+            if column in UNIQUE_INDEXES:
+                index, table, columns = UNIQUE_INDEXES[column]
+                connection.execute(sa.text(f"CREATE UNIQUE INDEX {quote(index)} ON {quote(table)} "
+                                           f"({', '.join(quote(c) for c in columns)})"))
+                logger.info(f"MIGRATIONS | Created unique index {index}")
+    return added
+
+
+def upgrade_schema(db, logger):
+    """Bring existing tables up to the current models; returns the added columns ('table.column')."""
+    try:
+        return _upgrade(db.engine, db.metadata, logger)
+    except SQLAlchemyError as e:
+        # Another process starting at the same time may have upgraded first; re-inspect once.
+        logger.warning(f"MIGRATIONS | Schema upgrade failed, retrying: {e}")
+        return _upgrade(db.engine, db.metadata, logger)
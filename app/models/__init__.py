@@ -1 +1,4 @@
-from .documents import PDF, Attachment
\ No newline at end of file
+from .documents import PDF, Attachment
+from .changes import DocumentChange, record_change
+from .versions import DocumentVersion, Chunk
+from .access import DocumentAccess, TieringDecision
@@ -0,0 +1,51 @@
+from datetime import datetime
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+
+from .. import db
+
+
+class DocumentAccess(db.Model):
+    """Read counters and storage tier of one PDF or attachment; counters are flushed in batches by AccessTracker."""
+    __tablename__ = 'document_access'
+    __table_args__ = (db.UniqueConstraint('entity', 'entity_id', name='uq_document_access_entity'),)
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)  # 'pdf' or 'attachment'
+    entity_id = db.Column(db.Integer, nullable=False)
+    reads = db.Column(db.BigInteger, nullable=False, default=0)  # all-time reads
+    recent_reads = db.Column(db.Float, nullable=False, default=0.0)  # reads decayed by TIERING_HALF_LIFE_HOURS
+    last_read_at = db.Column(db.DateTime, nullable=True)
+    decayed_at = db.Column(db.DateTime, nullable=True)  # time recent_reads is decayed to: first read, then each policy run
+    tier = db.Column(db.String(16), nullable=False, default='warm')  # 'hot', 'warm', 'cold' or 'archive'
+    replication = db.Column(db.Integer, nullable=True)  # replication factor last applied, None if never set
+    archived_from = db.Column(db.String(512), nullable=True)  # original stored_path while in the archive tier
+    tiered_at = db.Column(db.DateTime, nullable=True)
+
+
+class TieringDecision(db.Model):
+    """Log of tier changes made by the tiering policy job and what applying them did."""
+    __tablename__ = 'tiering_decisions'
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False, index=True)
+    from_tier = db.Column(db.String(16), nullable=False)
+    to_tier = db.Column(db.String(16), nullable=False)
+    reason = db.Column(db.String(256), nullable=False)
+    replication = db.Column(db.Integer, nullable=True)  # target replication factor
+    files_changed = db.Column(db.Integer, nullable=False, default=0)  # files whose replication was changed
+    moved_from = db.Column(db.String(512), nullable=True)
+    moved_to = db.Column(db.String(512), nullable=True)
+    applied = db.Column(db.Boolean, nullable=False, default=False)  # False for dry runs and failures
+    error = db.Column(db.String(512), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class DocumentAccessSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = DocumentAccess
+        load_instance = True
+
+
+class TieringDecisionSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = TieringDecision
+        load_instance = True
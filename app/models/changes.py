@@ -0,0 +1,63 @@
+from datetime import datetime
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+from sqlalchemy import event, text
+
+from .. import db
+
+ENTITY_NAMES = {'pdfs': 'pdf', 'attachments': 'attachment'}
+PENDING_CHANGES = 'pending_document_changes'
+CHANGE_FEED_LOCK = 0x646d6366  # pg_advisory_xact_lock key serialising change inserts until commit
+
+
+class DocumentChange(db.Model):
+    """Append-only log of create / replace / delete events; the id doubles as the feed cursor.
+
+    Ids are assigned in commit order (see _insert_changes), so a consumer that has read up to id N
+    has seen every change that will ever carry an id <= N."""
+    __tablename__ = 'document_changes'
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    entity = db.Column(db.String(16), nullable=False)  # 'pdf' or 'attachment'
+    entity_id = db.Column(db.Integer, nullable=False)
+    pdf_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(16), nullable=False)  # 'create', 'replace' or 'delete'
+    original_filename = db.Column(db.String(256), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+def record_change(action, document):
+    """Queue a change entry for a PDF or Attachment; it is inserted when the session commits, atomically with the write."""
+    if document.id is None:
+        db.session.flush()
+    db.session.info.setdefault(PENDING_CHANGES, []).append(DocumentChange(
+        entity=ENTITY_NAMES[document.__tablename__],
+        entity_id=document.id,
+        pdf_id=document.id if document.__tablename__ == 'pdfs' else document.pdf_id,
+        action=action,
+        original_filename=document.original_filename
+    ))
+
+
+@event.listens_for(db.session, 'before_commit')
+def _insert_changes(session):
+    """Insert the queued changes as the last statements of the transaction. On PostgreSQL a lock held
+    until commit makes concurrent transactions take their ids one after another, in commit order;
+    SQLite already serialises writing transactions. Inserting earlier (or on autoflush) would give a
+    change an id long before it commits, and a consumer could move its cursor past it."""
+    changes = session.info.pop(PENDING_CHANGES, None)
+    if not changes:
+        return
+    connection = session.connection(bind_arguments={'mapper': DocumentChange})
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CHANGE_FEED_LOCK})
+    session.add_all(changes)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop(PENDING_CHANGES, None)
+
+
+class DocumentChangeSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = DocumentChange
+        load_instance = True
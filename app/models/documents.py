@@ -1,27 +1,49 @@
 
+import unicodedata
 from datetime import datetime
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 
 from sqlalchemy.dialects.postgresql import JSONB
 from .. import db, ma
+from .versions import DocumentVersion
+
+
+def name_key(filename):
+    """Normalised lookup key for a filename: Unicode NFC, surrounding whitespace stripped, case folded."""
+    return unicodedata.normalize('NFC', filename).strip().casefold()
+
+
+def document_directory(parent, key):
+    """Storage directory of a PDF and its attachments: one per name key, so 'a.pdf' and 'a.png' never share one.
+    Path separators (and '%', to keep it unambiguous) are percent-encoded."""
+    escaped = key.replace('%', '%25').replace('/', '%2F').replace('\\', '%5C')
+    return f"{parent}/{escaped}"
 
 
 class PDF(db.Model):
     __tablename__ = 'pdfs'
     id = db.Column(db.Integer, primary_key=True)
     original_filename = db.Column(db.String(256), nullable=False)
+    name_key = db.Column(db.String(256), nullable=False, unique=True)  # see name_key()
     stored_path = db.Column(db.String(256), nullable=False, unique=True)
     sys_metadata = db.Column(JSONB, nullable=True)
+    checksum = db.Column(db.String(64), nullable=True)  # hex SHA-256 of the stored file
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    current_version = db.Column(db.Integer, nullable=True)  # None for files stored before versioning
     attachments = db.relationship('Attachment', backref='pdf', cascade='all, delete-orphan', lazy=True)
+    versions = db.relationship('DocumentVersion', backref='pdf', cascade='all, delete-orphan', lazy=True,
+                               order_by=DocumentVersion.version)
 
 class Attachment(db.Model):
     __tablename__ = 'attachments'
+    __table_args__ = (db.UniqueConstraint('pdf_id', 'name_key', name='uq_attachments_pdf_name_key'),)
     id = db.Column(db.Integer, primary_key=True)
     pdf_id = db.Column(db.Integer, db.ForeignKey('pdfs.id'), nullable=False)
     original_filename = db.Column(db.String(256), nullable=False)
+    name_key = db.Column(db.String(256), nullable=False)  # see name_key()
     stored_path= db.Column(db.String(256), nullable=False, unique=True)
     sys_metadata = db.Column(JSONB, nullable=True)
+    checksum = db.Column(db.String(64), nullable=True)  # hex SHA-256 of the stored file
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class PDFSchema(SQLAlchemyAutoSchema):
@@ -0,0 +1,35 @@
+from datetime import datetime
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
+
+from .. import db
+
+
+class DocumentVersion(db.Model):
+    __tablename__ = 'document_versions'
+    __table_args__ = (db.UniqueConstraint('pdf_id', 'version', name='uq_document_versions_pdf_version'),)
+    id = db.Column(db.Integer, primary_key=True)
+    pdf_id = db.Column(db.Integer, db.ForeignKey('pdfs.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)  # hex SHA-256 of the whole revision
+    chunks = db.Column(db.JSON, nullable=False)  # manifest: ordered list of chunk hashes
+    pinned = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Chunk(db.Model):
+    """A content-addressed chunk shared by every version that contains it."""
+    __tablename__ = 'chunks'
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # number of versions referencing the chunk
+    replication = db.Column(db.Integer, nullable=True)  # replication factor set by the tiering policy, None = default
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class DocumentVersionSchema(SQLAlchemyAutoSchema):
+    class Meta:
+        model = DocumentVersion
+        include_fk = True
+        load_instance = True
+        exclude = ('chunks',)
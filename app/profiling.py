@@ -0,0 +1,239 @@
+"""
+On-demand request profiling.
+
+With PROFILING_ENABLED set, a request is profiled when it carries a valid X-Profile-Signature
+header (see profile_signature()) or is picked by PROFILING_SAMPLE_RATE. A profiled request runs
+under cProfile, and every SQL statement and file manager call it makes is timed. The artefacts are
+written to PROFILING_DIRECTORY and served by /api/admin/profiles, which requires the same signed
+header since profiles contain SQL, full request paths and storage paths. With profiling disabled
+nothing is registered, so requests take exactly the same path as without this module.
+"""
+import contextvars
+import cProfile
+import hashlib
+import hmac
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from functools import wraps
+
+from flask import request
+from sqlalchemy import event
+
+PROFILE_HEADER = 'X-Profile-Signature'
+PROFILES_PATH = '/api/admin/profiles'
+MAX_PATH_LENGTH = 256
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_write_lock = threading.Lock()
+
+
+def profile_signature(secret, path, expires):
+    """Header value that asks for a profile of requests to `path` until the unix time `expires`."""
+    digest = hmac.new(secret.encode(), f"{int(expires)}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{int(expires)}.{digest}"
+
+
+def _valid_signature(secret, value, path):
+    expires, _, digest = value.partition('.')
+    if not secret or not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(profile_signature(secret, path, int(expires)), f"{expires}.{digest}")
+
+
+def has_valid_signature(secret):
+    """True if the current request carries an X-Profile-Signature signed for its own path."""
+    signature = request.headers.get(PROFILE_HEADER)
+    return signature is not None and _valid_signature(secret, signature, request.path)
+
+
+class RequestProfile:
+    def __init__(self, method, path, reason):
+        self.id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.reason = reason
+        self.started_at = datetime.utcnow()
+        self.sql = []
+        self.storage = []
+        self.profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+
+    def record_sql(self, statement, seconds):
+        self.sql.append({'statement': statement, 'ms': round(seconds * 1000, 3)})
+
+    def record_storage(self, operation, args, seconds, error=None):
+        self.storage.append({'operation': operation, 'args': args, 'ms': round(seconds * 1000, 3), 'error': error})
+
+    def summary(self, status_code):
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'reason': self.reason,
+            'status': status_code,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round((time.perf_counter() - self._started) * 1000, 3),
+            'sql_count': len(self.sql),
+            'sql_ms': round(sum(entry['ms'] for entry in self.sql), 3),
+            'storage_count': len(self.storage),
+            'storage_ms': round(sum(entry['ms'] for entry in self.storage), 3)
+        }
+
+
+def _storage_arguments(method, args, kwargs):
+    """Arguments of a file manager call as recorded in a profile. Paths are kept (truncated) and
+    options as they are; data arguments (chunk bytes, appended text) are recorded as their length,
+    so a profile never carries document content."""
+    try:
+        arguments = inspect.signature(method).bind(*args, **kwargs).arguments
+    except (TypeError, ValueError):
+        arguments = {f"arg{i}": arg for i, arg in enumerate([*args, *kwargs.values()])}
+    recorded = {}
+    for name, value in arguments.items():
+        if (name == 'path' or name.endswith('_path')) and isinstance(value, (str, os.PathLike)):
+            value = os.fspath(value)
+            recorded[name] = value if len(value) <= MAX_PATH_LENGTH else value[:MAX_PATH_LENGTH] + '...'
+        elif value is None or isinstance(value, (bool, int, float)):
+            recorded[name] = value
+        elif isinstance(value, (str, bytes, bytearray, memoryview)):
+            recorded[name] = {'length': len(value)}
+        else:
+            recorded[name] = type(value).__name__
+    return recorded
+
+
+class ProfiledFileManager:
+    """Wraps a file manager so calls made during a profiled request are timed."""
+
+    def __init__(self, file_manager):
+        self._file_manager = file_manager
+
+    def __getattr__(self, name):
+        attr = getattr(self._file_manager, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @wraps(attr)
+        def profiled(*args, **kwargs):
+            profile = _current.get()
+            if profile is None:
+                return attr(*args, **kwargs)
+            arguments = _storage_arguments(attr, args, kwargs)
+            started = time.perf_counter()
+            try:
+                result = attr(*args, **kwargs)
+            except Exception as e:
+                profile.record_storage(name, arguments, time.perf_counter() - started, str(e))
+                raise
+            profile.record_storage(name, arguments, time.perf_counter() - started)
+            return result
+        return profiled
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and conn.info.get('profile_query_start'):
+        profile.record_sql(statement, time.perf_counter() - conn.info['profile_query_start'].pop())
+
+
+def _write_profile(directory, profile, status_code, keep):
+    stats_text = io.StringIO()
+    pstats.Stats(profile.profiler, stream=stats_text).sort_stats('cumulative').print_stats(40)
+    document = {**profile.summary(status_code), 'sql': profile.sql, 'storage': profile.storage,
+                'top_functions': stats_text.getvalue()}
+    with _write_lock:
+        profile.profiler.dump_stats(os.path.join(directory, f"{profile.id}.prof"))
+        with open(os.path.join(directory, f"{profile.id}.json"), 'w') as f:
+            json.dump(document, f)
+        for stale in list_profiles(directory)[keep:]:
+            for extension in ('json', 'prof'):
+                path = os.path.join(directory, f"{stale['id']}.{extension}")
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def list_profiles(directory):
+    """Summaries of the stored profiles, newest first."""
+    profiles = []
+    for entry in sorted(os.listdir(directory), reverse=True):
+        if entry.endswith('.json'):
+            with open(os.path.join(directory, entry)) as f:
+                document = json.load(f)
+            profiles.append({key: value for key, value in document.items()
+                             if key not in ('sql', 'storage', 'top_functions')})
+    return profiles
+
+
+def profile_path(directory, profile_id, extension):
+    """Path of a stored profile artefact, or None if there is no such profile."""
+    if not all(c.isalnum() or c == '-' for c in profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.{extension}")
+    return path if os.path.exists(path) else None
+
+
+def init_profiling(app, db):
+    """Register the profiling hooks; a no-op unless PROFILING_ENABLED is set."""
+    if not app.config['PROFILING_ENABLED']:
+        return
+    directory = app.config['PROFILING_DIRECTORY']
+    secret = app.config['PROFILING_SECRET']
+    sample_rate = app.config['PROFILING_SAMPLE_RATE']
+    keep = app.config['PROFILING_MAX_PROFILES']
+    os.makedirs(directory, exist_ok=True)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        stale = _current.get()
+        if stale is not None:
+            # The previous request on this thread never closed its response.
+            stale.profiler.disable()
+            _current.set(None)
+        if request.path.startswith(PROFILES_PATH):
+            return  # the signature authorises reading profiles, not profiling the read
+        if has_valid_signature(secret):
+            reason = 'signed'
+        elif sample_rate > 0 and random.random() < sample_rate:
+            reason = 'sampled'
+        else:
+            return
+        profile = RequestProfile(request.method, request.full_path.rstrip('?'), reason)
+        _current.set(profile)
+        profile.profiler.enable()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = _current.get()
+        if profile is None:
+            return response
+        response.headers['X-Profile-Id'] = profile.id
+
+        # Streamed responses do most of their work after this hook, so finish when the body is closed.
+        def finish():
+            profile.profiler.disable()
+            _current.set(None)
+            try:
+                _write_profile(directory, profile, response.status_code, keep)
+                app.logger.info(f"PROFILING | Stored profile {profile.id} for {profile.method} {profile.path}")
+            except OSError as e:
+                app.logger.error(f"PROFILING | Could not store profile {profile.id}: {e}")
+        response.call_on_close(finish)
+        return response
@@ -0,0 +1,69 @@
+from flask import Blueprint, jsonify, current_app, abort, request, send_file
+
+from .. import db
+from ..admission import admission_stats
+from ..models.access import DocumentAccess, TieringDecision, TieringDecisionSchema
+from ..profiling import PROFILE_HEADER, has_valid_signature, list_profiles, profile_path
+from ..write_behind import write_behind_dead_letters, write_behind_stats
+
+admin_bp = Blueprint('admin', __name__)
+
+
+@admin_bp.route('/limits', methods=['GET'])
+def get_limits():
+    current_app.logger.info("ADMIN_BP | Admission limits requested")
+    return jsonify(admission_stats())
+
+
+@admin_bp.route('/replication', methods=['GET'])
+def get_replication():
+    current_app.logger.info("ADMIN_BP | Write-behind replication stats requested")
+    return jsonify(write_behind_stats())
+
+
+@admin_bp.route('/replication/dead-letter', methods=['GET'])
+def get_dead_letters():
+    current_app.logger.info("ADMIN_BP | Write-behind dead-letter records requested")
+    return jsonify(write_behind_dead_letters())
+
+
+def _profiles_directory():
+    if not current_app.config['PROFILING_ENABLED']:
+        abort(404, 'Profiling is disabled')
+    if not has_valid_signature(current_app.config['PROFILING_SECRET']):
+        current_app.logger.warning(f"ADMIN_BP | Rejected profile access without a valid signature: {request.path}")
+        abort(403, f'A valid {PROFILE_HEADER} header signed for this path is required')
+    return current_app.config['PROFILING_DIRECTORY']
+
+
+@admin_bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    current_app.logger.info("ADMIN_BP | Listing stored request profiles")
+    return jsonify(list_profiles(_profiles_directory()))
+
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    current_app.logger.info(f"ADMIN_BP | Profile report requested: {profile_id}")
+    path = profile_path(_profiles_directory(), profile_id, 'json')
+    if path is None:
+        abort(404, f'Profile {profile_id} not found')
+    return send_file(path, mimetype='application/json')
+
+
+@admin_bp.route('/profiles/<profile_id>/download', methods=['GET'])
+def download_profile(profile_id):
+    current_app.logger.info(f"ADMIN_BP | Profile download requested: {profile_id}")
+    path = profile_path(_profiles_directory(), profile_id, 'prof')
+    if path is None:
+        abort(404, f'Profile {profile_id} not found')
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}.prof")
+
+
+@admin_bp.route('/tiering', methods=['GET'])
+def get_tiering():
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    current_app.logger.info(f"ADMIN_BP | Tiering state requested (last {limit} decisions)")
+    tiers = dict(db.session.query(DocumentAccess.tier, db.func.count()).group_by(DocumentAccess.tier))
+    decisions = TieringDecision.query.order_by(TieringDecision.id.desc()).limit(limit).all()
+    return jsonify({'tiers': tiers, 'decisions': TieringDecisionSchema(many=True).dump(decisions)})
@@ -1,15 +1,25 @@
 import os
-from flask import Blueprint, request, jsonify, current_app, abort, send_file
-from sqlalchemy import and_
-from sqlalchemy.exc import SQLAlchemyError
+import uuid
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, abort
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from .. import db, file_manager
-from ..models.documents import Attachment, AttachmentSchema, PDF
+from ..access import record_access
+from ..admission import Overloaded, admit, send_throttled_file
+from ..db_routing import read_only, use_read_replica
+from ..file_systems.checksum import sha256_file
+from ..locks import upload_locks
+from ..models.changes import record_change
+from ..models.documents import Attachment, AttachmentSchema, PDF, document_directory, name_key
+from ..serialization import batch_ids, batch_response, json_row_response, rows_by_id, select_rows, stream_json_array
+from ..write_behind import replication_state
 import json
 
 attachment_bp = Blueprint('attachments', __name__)
 attachment_schema = AttachmentSchema()
 
 @attachment_bp.route('/<int:pdf_id>/', methods=['POST'])
+@admit('upload')
 def upload_attachment(pdf_id):
     current_app.logger.info(f"ATTACHMENT_BP | Upload request received for PDF ID: {pdf_id}")
     pdf = PDF.query.get_or_404(pdf_id)
@@ -32,45 +42,80 @@ def upload_attachment(pdf_id):
         abort(400, 'Metadata must be valid JSON')
 
     stored_filename = file.filename
-    tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], stored_filename)
+    tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], f"{uuid.uuid4().hex}-{stored_filename}")
     file.save(tmp_path)
+    checksum = sha256_file(tmp_path)
     current_app.logger.info(f"ATTACHMENT_BP | File saved temporarily at {tmp_path}")
 
+    key = name_key(file.filename)
+    storage_dir = f"{document_directory(current_app.config['PARENT_DIRECTORY'], pdf.name_key)}/attachments"
+    # Every revision gets its own object name, so the previous file stays readable until the row is swapped.
+    final_path = f"{storage_dir}/{uuid.uuid4().hex[:12]}_{stored_filename}"
+    attachment = None
     try:
-        query = Attachment.query.filter(
-            and_(
-                Attachment.original_filename.ilike(f"%{file.filename}%"),
-                Attachment.pdf_id == pdf.id
-            )
-        )
-        attachments = query.all()
-        if len(attachments) != 0:
-            current_app.logger.info(f"ATTACHMENT_BP | Existing attachment found for PDF ID {pdf_id}, deleting old record.")
-            delete_attachment(attachment_id=attachments[0].id)
-        storage_dir = f"{current_app.config['PARENT_DIRECTORY']}/{pdf.original_filename.split('.')[0]}/attachments"
-        attachment = Attachment(
-            pdf_id=pdf.id,
-            original_filename=file.filename,
-            stored_path=f"{storage_dir}/{stored_filename}",
-            sys_metadata=user_meta
-        )
-        db.session.add(attachment)
-        current_app.logger.info(f"ATTACHMENT_BP | New attachment record created for PDF ID {pdf_id}: {stored_filename}")
-        db.session.commit()
-        current_app.logger.info(f"ATTACHMENT_BP | Attachment committed to database for PDF ID {pdf_id}")
-        file_manager.create_directory(path=storage_dir)
-        file_manager.upload_file(local_path=tmp_path, storage_path=f"{storage_dir}/{stored_filename}")
-        current_app.logger.info(f"ATTACHMENT_BP | File uploaded to storage: {storage_dir}/{stored_filename}")
-
+        with upload_locks.hold(('attachment', pdf.id, key)):
+            staging_path = f"{storage_dir}/.staging/{uuid.uuid4().hex}"
+            file_manager.create_directory(path=f"{storage_dir}/.staging")
+            file_manager.upload_file(local_path=tmp_path, storage_path=staging_path)
+            file_manager.rename(staging_path, final_path)
+            current_app.logger.info(f"ATTACHMENT_BP | File uploaded to storage: {final_path}")
+            try:
+                attachment, old_path = _swap_attachment(pdf, file.filename, key, final_path, checksum, user_meta)
+            except IntegrityError:
+                # Another process created the same name between our lookup and commit; it is an update now.
+                db.session.rollback()
+                current_app.logger.info(f"ATTACHMENT_BP | Concurrent upload created {stored_filename}, retrying as update")
+                attachment, old_path = _swap_attachment(pdf, file.filename, key, final_path, checksum, user_meta)
+        if old_path is not None:
+            file_manager.delete_directory(old_path)
+            current_app.logger.info(f"ATTACHMENT_BP | Replaced attachment file removed: {old_path}")
     except Exception as e:
-        current_app.logger.error(f"ATTACHMENT_BP | Database error during attachment upload: {e}")
+        current_app.logger.error(f"ATTACHMENT_BP | Error during attachment upload: {e}")
         db.session.rollback()
+        if attachment is None and file_manager.exists(final_path):
+            file_manager.delete_directory(final_path)
+        if isinstance(e, Overloaded):
+            raise
         abort(500, str(e))
-    os.remove(tmp_path)
-    current_app.logger.info(f"ATTACHMENT_BP | Temporary file removed: {tmp_path}")
+    finally:
+        os.remove(tmp_path)
+        current_app.logger.info(f"ATTACHMENT_BP | Temporary file removed: {tmp_path}")
     return jsonify(attachment_schema.dump(attachment)), 201
 
+def _swap_attachment(pdf, filename, key, stored_path, checksum, user_meta):
+    """Point the attachment with this name key at the new file (or create it) in a single transaction.
+    Returns the attachment and the path of the file it replaced, if any."""
+    attachment = Attachment.query.filter_by(pdf_id=pdf.id, name_key=key).with_for_update().first()
+    old_path = None
+    if attachment is not None:
+        current_app.logger.info(f"ATTACHMENT_BP | Existing attachment found for PDF ID {pdf.id}, replacing: {filename}")
+        old_path = attachment.stored_path
+        attachment.original_filename = filename
+        attachment.stored_path = stored_path
+        attachment.sys_metadata = user_meta
+        attachment.checksum = checksum
+        attachment.uploaded_at = datetime.utcnow()
+        action = 'replace'
+    else:
+        attachment = Attachment(
+            pdf_id=pdf.id,
+            original_filename=filename,
+            name_key=key,
+            stored_path=stored_path,
+            sys_metadata=user_meta,
+            checksum=checksum
+        )
+        db.session.add(attachment)
+        current_app.logger.info(f"ATTACHMENT_BP | New attachment record created for PDF ID {pdf.id}: {filename}")
+        action = 'create'
+    record_change(action, attachment)
+    db.session.commit()
+    current_app.logger.info(f"ATTACHMENT_BP | Attachment committed to database for PDF ID {pdf.id}")
+    return attachment, old_path
+
 @attachment_bp.route('/', methods=['GET'])
+@admit('metadata')
+@use_read_replica
 def list_attachments():
     pdf_id = request.args.get('pdf_id')
     name = request.args.get('name')
@@ -78,40 +123,63 @@ def list_attachments():
     meta_value = request.args.get('meta_value')
     current_app.logger.info(f"ATTACHMENT_BP | Listing attachments with filters - name: {name}, meta_key: {meta_key}, meta_value: {meta_value}")
 
-    query = Attachment.query
+    statement = select_rows(Attachment)
     if pdf_id is not None:
-        query = query.filter(Attachment.pdf_id == pdf_id)
+        statement = statement.where(Attachment.pdf_id == pdf_id)
     if name:
-        query = query.filter(Attachment.original_filename.ilike(f"%{name}%"))
+        statement = statement.where(Attachment.original_filename.ilike(f"%{name}%"))
     if meta_key and meta_value:
-        query = query.filter(Attachment.sys_metadata[meta_key].astext == meta_value)
-
-    attachments = query.all()
-    current_app.logger.info(f"ATTACHMENT_BP | Found {len(attachments)} attachments matching filters")
-    return jsonify(attachment_schema.dump(attachments, many=True))
+        statement = statement.where(Attachment.sys_metadata[meta_key].astext == meta_value)
+    return stream_json_array(statement.order_by(Attachment.id), Attachment)
 
 @attachment_bp.route('/download/<int:attachment_id>', methods=['GET'])
+@admit('download')
+@use_read_replica
 def download_pdf(attachment_id):
     current_app.logger.info(f"ATTACHMENT_BP | Download requested for attachment ID: {attachment_id}")
     attachment = Attachment.query.get_or_404(attachment_id)
+    record_access('attachment', attachment.id)
     tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], attachment.original_filename)
     file_manager.download_file(src_path=attachment.stored_path, local_path=tmp_path)
     current_app.logger.info(f"ATTACHMENT_BP | Attachment downloaded to temporary path: {tmp_path}")
-    return send_file(tmp_path, as_attachment=True, download_name=attachment.original_filename)
+    return send_throttled_file(tmp_path, attachment.original_filename)
 
 @attachment_bp.route('/<int:attachment_id>', methods=['GET'])
+@admit('metadata')
+@use_read_replica
 def get_attachment(attachment_id):
     current_app.logger.info(f"ATTACHMENT_BP | Fetching metadata for attachment ID: {attachment_id}")
+    row = db.session.execute(select_rows(Attachment).where(Attachment.id == attachment_id)).first()
+    if row is None:
+        abort(404)
+    return json_row_response(row, Attachment)
+
+@attachment_bp.route('/<int:attachment_id>/replication', methods=['GET'])
+@admit('metadata')
+@use_read_replica
+def get_attachment_replication(attachment_id):
+    current_app.logger.info(f"ATTACHMENT_BP | Replication state requested for attachment ID: {attachment_id}")
     attachment = Attachment.query.get_or_404(attachment_id)
-    return jsonify(attachment_schema.dump(attachment))
+    return jsonify(replication_state([attachment.stored_path]))
+
+@attachment_bp.route('/batch', methods=['POST'])
+@admit('metadata')
+@read_only
+@use_read_replica
+def get_attachments_batch():
+    ids = batch_ids()
+    current_app.logger.info(f"ATTACHMENT_BP | Batch metadata requested for {len(ids)} attachments")
+    return batch_response(ids, rows_by_id(Attachment, ids))
 
 @attachment_bp.route('/<int:attachment_id>', methods=['DELETE'])
+@admit('delete')
 def delete_attachment(attachment_id):
     current_app.logger.info(f"ATTACHMENT_BP | Delete requested for attachment ID: {attachment_id}")
     attachment = Attachment.query.get_or_404(attachment_id)
     try:
         file_manager.delete_directory(attachment.stored_path)
         current_app.logger.info(f"ATTACHMENT_BP | Attachment file deleted from storage: {attachment.stored_path}")
+        record_change('delete', attachment)
         db.session.delete(attachment)
         db.session.commit()
         current_app.logger.info(f"ATTACHMENT_BP | Attachment record deleted from database: {attachment_id}")
@@ -119,6 +187,8 @@ def delete_attachment(attachment_id):
         db.session.rollback()
         current_app.logger.error(f"ATTACHMENT_BP | SQLAlchemy error during attachment deletion: {e}")
         abort(500, str(e))
+    except Overloaded:
+        raise
     except Exception as e:
         current_app.logger.error(f"ATTACHMENT_BP | File deletion failed for attachment {attachment_id}: {e}")
         abort(500, f"File deletion failed: {e}")
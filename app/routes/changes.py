@@ -0,0 +1,44 @@
+import time
+
+from flask import Blueprint, request, jsonify, current_app
+
+from .. import db
+from ..admission import admit
+from ..models.changes import DocumentChange, DocumentChangeSchema
+
+changes_bp = Blueprint('changes', __name__)
+change_schema = DocumentChangeSchema()
+
+
+def _fetch_changes(after, limit):
+    # Ids are assigned in commit order (see models.changes), so no committed change can appear behind `after`.
+    return (DocumentChange.query
+            .filter(DocumentChange.id > after)
+            .order_by(DocumentChange.id)
+            .limit(limit)
+            .all())
+
+
+# Served from the primary: a lagging replica (or a different replica per request) could answer
+# with an older snapshot than the cursor the client got from the previous poll.
+@changes_bp.route('/', methods=['GET'], strict_slashes=False)
+@admit('changes')
+def list_changes():
+    after = request.args.get('after', 0, type=int)
+    limit = request.args.get('limit', current_app.config['CHANGE_FEED_DEFAULT_LIMIT'], type=int)
+    limit = max(1, min(limit, current_app.config['CHANGE_FEED_MAX_LIMIT']))
+    wait = request.args.get('wait', 0, type=float)
+    wait = max(0.0, min(wait, current_app.config['CHANGE_FEED_MAX_WAIT']))
+    current_app.logger.info(f"CHANGES_BP | Change feed requested - after: {after}, limit: {limit}, wait: {wait}")
+
+    deadline = time.monotonic() + wait
+    changes = _fetch_changes(after, limit)
+    while not changes and time.monotonic() < deadline:
+        # End the read transaction so the next poll sees newly committed changes.
+        db.session.rollback()
+        time.sleep(min(current_app.config['CHANGE_FEED_POLL_INTERVAL'], max(0.0, deadline - time.monotonic())))
+        changes = _fetch_changes(after, limit)
+
+    next_cursor = changes[-1].id if changes else after
+    current_app.logger.info(f"CHANGES_BP | Returning {len(changes)} changes, next cursor: {next_cursor}")
+    return jsonify({'changes': change_schema.dump(changes, many=True), 'next_cursor': next_cursor})
@@ -1,16 +1,33 @@
 import json
+import mimetypes
 import os
+import uuid
+from datetime import datetime
 
-from flask import Blueprint, request, jsonify, current_app, abort, send_file
-from sqlalchemy.exc import SQLAlchemyError
+from flask import Blueprint, request, jsonify, current_app, abort, Response, stream_with_context
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from werkzeug.http import dump_options_header
 
 from .. import db, file_manager
-from ..models.documents import PDF, PDFSchema
+from ..access import record_access
+from ..admission import Overloaded, admit, client_id, send_throttled_file, throttle
+from ..db_routing import read_only, use_read_replica
+from ..file_systems.checksum import sha256_file
+from ..locks import upload_locks
+from ..models.changes import record_change
+from ..models.documents import Attachment, PDF, PDFSchema, document_directory, name_key
+from ..models.versions import DocumentVersionSchema
+from ..serialization import batch_ids, batch_response, json_row_response, rows_by_id, select_rows, stream_json_array
+from ..versions import (chunk_path, create_version, delete_chunks, get_version, prepare_version, prune_versions,
+                        release_versions, stream_version, verify_chunks)
+from ..write_behind import replication_state
 
 pdf_bp = Blueprint('pdfs', __name__)
 pdf_schema = PDFSchema()
+version_schema = DocumentVersionSchema()
 
 @pdf_bp.route('/', methods=['POST'])
+@admit('upload')
 def upload_pdf():
     current_app.logger.info(f"PDF_BP | PDF_BP | PDF upload request received.")
     if 'file' not in request.files:
@@ -32,85 +49,258 @@ def upload_pdf():
         abort(400, 'Metadata must be valid JSON')
 
     stored_filename = file.filename
-    tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], stored_filename)
+    tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], f"{uuid.uuid4().hex}-{stored_filename}")
     file.save(tmp_path)
+    checksum = sha256_file(tmp_path)
     current_app.logger.info(f"PDF_BP | File saved temporarily at {tmp_path}")
 
+    key = name_key(file.filename)
     try:
-        query = PDF.query.filter(PDF.original_filename.ilike(f"%{file.filename}%"))
-        pdfs = query.all()
-        if len(pdfs) != 0:
-            current_app.logger.info(f"PDF_BP | Existing PDF found, deleting old record for: {stored_filename}")
-            delete_pdf(pdf_id=pdfs[0].id)
-        storage_dir = f"{current_app.config['PARENT_DIRECTORY']}/{file.filename.split('.')[0]}"
-        pdf = PDF(
-            original_filename=file.filename,
-            stored_path=f"{storage_dir}/{stored_filename}",
-            sys_metadata=user_meta
-        )
-        db.session.add(pdf)
-        current_app.logger.info(f"PDF_BP | New PDF record created: {stored_filename}")
-        db.session.commit()
-        current_app.logger.info(f"PDF_BP | PDF committed to database: {stored_filename}")
-        file_manager.create_directory(path=storage_dir)
-        file_manager.upload_file(local_path=tmp_path, storage_path=f"{storage_dir}/{stored_filename}")
-        current_app.logger.info(f"PDF_BP | File uploaded to storage: {storage_dir}/{stored_filename}")
+        # Chunking and chunk writes happen before any lock; the locked transaction only records references.
+        prepared = prepare_version(tmp_path)
+        legacy = _prepare_legacy_file(key, tmp_path)
+        with upload_locks.hold(('pdf', key)):
+            try:
+                pdf = _store_pdf(file.filename, key, tmp_path, prepared, legacy, checksum, user_meta)
+            except IntegrityError:
+                # Another process created the same name between our lookup and commit; it is an update now.
+                db.session.rollback()
+                current_app.logger.info(f"PDF_BP | Concurrent upload created {stored_filename}, retrying as update")
+                pdf = _store_pdf(file.filename, key, tmp_path, prepared, legacy, checksum, user_meta)
+        for preparation in [prepared] + ([legacy[1]] if legacy is not None else []):
+            rewritten = verify_chunks(preparation)
+            if rewritten:
+                current_app.logger.warning(f"PDF_BP | Rewrote {len(rewritten)} chunks collected during the upload")
     except SQLAlchemyError as e:
         db.session.rollback()
         current_app.logger.error(f"PDF_BP | Database error during PDF upload: {e}")
         abort(500, str(e))
-    os.remove(tmp_path)
-    current_app.logger.info(f"PDF_BP | Temporary file removed: {tmp_path}")
+    finally:
+        os.remove(tmp_path)
+        current_app.logger.info(f"PDF_BP | Temporary file removed: {tmp_path}")
     return jsonify(pdf_schema.dump(pdf)), 201
 
+def _store_pdf(filename, key, tmp_path, prepared, legacy, checksum, user_meta):
+    """Insert a new PDF or add a version to the one with the same name key, in a single transaction."""
+    pdf = PDF.query.filter_by(name_key=key).with_for_update().first()
+    legacy_path = None
+    imported = None
+    if pdf is not None:
+        current_app.logger.info(f"PDF_BP | Existing PDF found, adding a new version for: {filename}")
+        if pdf.current_version is None and file_manager.exists(pdf.stored_path):
+            legacy_path = pdf.stored_path
+            if legacy is not None and legacy[0] == legacy_path:
+                create_version(pdf, legacy[1], legacy[2])
+                current_app.logger.info(f"PDF_BP | Imported pre-versioning file as version 1: {legacy_path}")
+            else:
+                # Moved (e.g. archived) since it was prepared: import it under the lock after all.
+                imported = _import_legacy_file(pdf, tmp_path)
+        pdf.sys_metadata = user_meta
+        pdf.uploaded_at = datetime.utcnow()
+        action = 'replace'
+    else:
+        storage_dir = document_directory(current_app.config['PARENT_DIRECTORY'], key)
+        pdf = PDF(
+            original_filename=filename,
+            name_key=key,
+            stored_path=f"{storage_dir}/{filename}",
+            sys_metadata=user_meta,
+            checksum=checksum
+        )
+        db.session.add(pdf)
+        current_app.logger.info(f"PDF_BP | New PDF record created: {filename}")
+        action = 'create'
+    version = create_version(pdf, prepared, checksum)
+    current_app.logger.info(f"PDF_BP | Stored version {version.version} of {filename} ({len(version.chunks)} chunks)")
+    garbage = prune_versions(pdf)
+    record_change(action, pdf)
+    db.session.commit()
+    current_app.logger.info(f"PDF_BP | PDF committed to database: {filename}")
+    if imported is not None:
+        verify_chunks(imported)
+    delete_chunks(garbage)
+    if legacy_path is not None:
+        file_manager.delete_directory(legacy_path)
+        current_app.logger.info(f"PDF_BP | Pre-versioning file replaced by chunked version: {legacy_path}")
+    return pdf
+
+def _prepare_legacy_file(key, tmp_path):
+    """If the upload replaces a file stored before versioning, prepare that file as version 1.
+    :return: (stored_path, PreparedVersion, checksum) or None"""
+    pdf = PDF.query.filter_by(name_key=key).first()
+    legacy = pdf is not None and pdf.current_version is None and file_manager.exists(pdf.stored_path)
+    stored_path, checksum = (pdf.stored_path, pdf.checksum) if legacy else (None, None)
+    db.session.rollback()
+    if not legacy:
+        return None
+    legacy_tmp_path = f"{tmp_path}.legacy"
+    file_manager.download_file(src_path=stored_path, local_path=legacy_tmp_path)
+    try:
+        return stored_path, prepare_version(legacy_tmp_path), checksum or sha256_file(legacy_tmp_path)
+    finally:
+        os.remove(legacy_tmp_path)
+
+def _import_legacy_file(pdf, tmp_path):
+    """Store a file uploaded before versioning as version 1, so it stays in the history.
+    :return: The PreparedVersion, for verify_chunks() after committing"""
+    legacy_tmp_path = f"{tmp_path}.legacy"
+    file_manager.download_file(src_path=pdf.stored_path, local_path=legacy_tmp_path)
+    try:
+        prepared = prepare_version(legacy_tmp_path, end_transaction=False)
+        create_version(pdf, prepared, pdf.checksum or sha256_file(legacy_tmp_path))
+    finally:
+        os.remove(legacy_tmp_path)
+    current_app.logger.info(f"PDF_BP | Imported pre-versioning file as version 1: {pdf.stored_path}")
+    return prepared
+
+def _version_response(pdf, version):
+    headers = {
+        'Content-Disposition': dump_options_header('attachment', {'filename': pdf.original_filename}),
+        'Content-Length': str(version.size)
+    }
+    mimetype = mimetypes.guess_type(pdf.original_filename)[0] or 'application/octet-stream'
+    blocks = throttle(stream_version(version), client_id())
+    return Response(stream_with_context(blocks), mimetype=mimetype, headers=headers)
+
 @pdf_bp.route('/', methods=['GET'])
+@admit('metadata')
+@use_read_replica
 def list_pdfs():
     name = request.args.get('name', "")
     meta_key = request.args.get('meta_key')
     meta_value = request.args.get('meta_value')
     current_app.logger.info(f"PDF_BP | Listing PDFs with filters - name: {name}, meta_key: {meta_key}, meta_value: {meta_value}")
 
-    query = PDF.query
+    statement = select_rows(PDF)
     if name:
-        query = query.filter(PDF.original_filename.ilike(f"%{name}%"))
+        statement = statement.where(PDF.original_filename.ilike(f"%{name}%"))
     if meta_key and meta_value:
-        query = query.filter(PDF.sys_metadata[meta_key].astext == meta_value)
-
-    pdfs = query.all()
-    current_app.logger.info(f"PDF_BP | Found {len(pdfs)} PDFs matching filters.")
-    return jsonify(pdf_schema.dump(pdfs, many=True))
+        statement = statement.where(PDF.sys_metadata[meta_key].astext == meta_value)
+    return stream_json_array(statement.order_by(PDF.id), PDF)
 
 @pdf_bp.route('/download/<int:pdf_id>', methods=['GET'])
+@admit('download')
+@use_read_replica
 def download_pdf(pdf_id):
     current_app.logger.info(f"PDF_BP | Download requested for PDF ID: {pdf_id}")
     pdf = PDF.query.get_or_404(pdf_id)
+    record_access('pdf', pdf.id)
+    version = get_version(pdf)
+    if version is not None:
+        current_app.logger.info(f"PDF_BP | Streaming version {version.version} of PDF ID: {pdf_id}")
+        return _version_response(pdf, version)
+    tmp_path = download_legacy_file(pdf)
+    return send_throttled_file(tmp_path, pdf.original_filename)
+
+def download_legacy_file(pdf):
+    """Copy a file stored before versioning to the temporary directory and return its path."""
     tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], pdf.original_filename)
     file_manager.download_file(src_path=pdf.stored_path, local_path=tmp_path)
     current_app.logger.info(f"PDF_BP | PDF downloaded to temporary path: {tmp_path}")
-    return send_file(tmp_path, as_attachment=True, download_name=pdf.original_filename)
+    return tmp_path
 
 @pdf_bp.route('/<int:pdf_id>', methods=['GET'])
+@admit('metadata')
+@use_read_replica
 def get_pdf(pdf_id):
     current_app.logger.info(f"PDF_BP | Fetching metadata for PDF ID: {pdf_id}")
-    pdf = PDF.query.get_or_404(pdf_id)
-    return jsonify(pdf_schema.dump(pdf))
+    row = db.session.execute(select_rows(PDF).where(PDF.id == pdf_id)).first()
+    if row is None:
+        abort(404)
+    return json_row_response(row, PDF)
+
+@pdf_bp.route('/batch', methods=['POST'])
+@admit('metadata')
+@read_only
+@use_read_replica
+def get_pdfs_batch():
+    ids = batch_ids()
+    current_app.logger.info(f"PDF_BP | Batch metadata requested for {len(ids)} PDFs")
+    pdfs = rows_by_id(PDF, ids)
+    attachments = rows_by_id(Attachment, list(pdfs), column=Attachment.pdf_id)
+    for pdf_id, pdf in pdfs.items():
+        pdf['attachments'] = attachments.get(pdf_id, [])
+    return batch_response(ids, pdfs)
 
 @pdf_bp.route('/<int:pdf_id>', methods=['DELETE'])
+@admit('delete')
 def delete_pdf(pdf_id):
     current_app.logger.info(f"PDF_BP | Delete requested for PDF ID: {pdf_id}")
     pdf = PDF.query.get_or_404(pdf_id)
     try:
-        storage_dir = f"{current_app.config['PARENT_DIRECTORY']}/{pdf.original_filename.split('.')[0]}"
+        storage_dir = document_directory(current_app.config['PARENT_DIRECTORY'], pdf.name_key)
         file_manager.delete_directory(storage_dir)
         current_app.logger.info(f"PDF_BP | PDF file deleted from storage: {storage_dir}")
+        # Files moved to the archive tier, or not yet moved by app.tools.storage_layout, live outside it.
+        for path in [pdf.stored_path] + [attachment.stored_path for attachment in pdf.attachments]:
+            if path and not path.startswith(f"{storage_dir}/") and file_manager.exists(path):
+                file_manager.delete_directory(path)
+        garbage = release_versions(pdf.versions)
+        for attachment in pdf.attachments:
+            record_change('delete', attachment)
+        record_change('delete', pdf)
         db.session.delete(pdf)
         db.session.commit()
         current_app.logger.info(f"PDF_BP | PDF record deleted from database: {pdf_id}")
+        collected = delete_chunks(garbage)
+        current_app.logger.info(f"PDF_BP | Released {len(collected)} unreferenced chunks for PDF ID: {pdf_id}")
     except SQLAlchemyError as e:
         db.session.rollback()
         current_app.logger.error(f"PDF_BP | SQLAlchemy error during PDF deletion: {e}")
         abort(500, str(e))
+    except Overloaded:
+        raise
     except Exception as e:
         current_app.logger.error(f"PDF_BP | File deletion failed for PDF {pdf_id}: {e}")
         abort(500, f"File deletion failed: {e}")
     return jsonify({'message': 'PDF deleted successfully'}), 200
+
+@pdf_bp.route('/<int:pdf_id>/replication', methods=['GET'])
+@admit('metadata')
+@use_read_replica
+def get_pdf_replication(pdf_id):
+    current_app.logger.info(f"PDF_BP | Replication state requested for PDF ID: {pdf_id}")
+    pdf = PDF.query.get_or_404(pdf_id)
+    paths = {chunk_path(chunk_hash) for version in pdf.versions for chunk_hash in version.chunks}
+    paths.update(attachment.stored_path for attachment in pdf.attachments)
+    if pdf.current_version is None:
+        paths.add(pdf.stored_path)
+    return jsonify(replication_state(paths))
+
+@pdf_bp.route('/<int:pdf_id>/versions', methods=['GET'])
+@admit('metadata')
+@use_read_replica
+def list_versions(pdf_id):
+    current_app.logger.info(f"PDF_BP | Listing versions for PDF ID: {pdf_id}")
+    pdf = PDF.query.get_or_404(pdf_id)
+    return jsonify(version_schema.dump(pdf.versions, many=True))
+
+@pdf_bp.route('/<int:pdf_id>/versions/<int:version_number>', methods=['GET'])
+@admit('download')
+@use_read_replica
+def download_version(pdf_id, version_number):
+    current_app.logger.info(f"PDF_BP | Download requested for version {version_number} of PDF ID: {pdf_id}")
+    pdf = PDF.query.get_or_404(pdf_id)
+    version = get_version(pdf, version_number)
+    if version is None:
+        abort(404, f'Version {version_number} not found')
+    record_access('pdf', pdf.id)
+    return _version_response(pdf, version)
+
+@pdf_bp.route('/<int:pdf_id>/versions/<int:version_number>/pin', methods=['POST', 'DELETE'])
+@admit('metadata')
+def pin_version(pdf_id, version_number):
+    pinned = request.method == 'POST'
+    current_app.logger.info(f"PDF_BP | Setting pinned={pinned} on version {version_number} of PDF ID: {pdf_id}")
+    pdf = PDF.query.get_or_404(pdf_id)
+    version = get_version(pdf, version_number)
+    if version is None:
+        abort(404, f'Version {version_number} not found')
+    try:
+        version.pinned = pinned
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"PDF_BP | SQLAlchemy error while pinning version: {e}")
+        abort(500, str(e))
+    return jsonify(version_schema.dump(version))
@@ -4,14 +4,20 @@ import shutil
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app
 from werkzeug.utils import secure_filename
 
-from .pdfs import pdf_schema, download_pdf
+from .pdfs import pdf_schema, download_legacy_file
+from ..access import record_access
+from ..admission import admit
+from ..db_routing import use_read_replica
 from ..models.documents import PDF
+from ..versions import get_version, write_version
 import requests
 
 ui_bp = Blueprint('ui', __name__)
 API_PREFIX = '/api'
 
 @ui_bp.route('/')
+@admit('metadata')
+@use_read_replica
 def index():
     current_app.logger.info(' UI |  Index page accessed.')
     pdfs = PDF.query.all()
@@ -19,13 +25,19 @@ def index():
     return render_template('index.html', pdfs=pdfs, many=True)
 
 @ui_bp.route('/pdf/<int:pdf_id>')
+@admit('download')
+@use_read_replica
 def view_pdf(pdf_id):
     current_app.logger.info(f' UI |  View PDF requested for PDF ID: {pdf_id}')
     pdf = PDF.query.get_or_404(pdf_id)
-    download_pdf(pdf_id=pdf_id)
-    tmp_path = os.path.join(current_app.config['TMP_DIRECTORY'], pdf.original_filename)
+    record_access('pdf', pdf.id)
     static_path = os.path.join(current_app.config['STATIC_DIRECTORY'], pdf.original_filename)
-    shutil.copy(tmp_path, static_path)
+    version = get_version(pdf)
+    if version is not None:
+        write_version(version, static_path)
+    else:
+        tmp_path = download_legacy_file(pdf)
+        shutil.copy(tmp_path, static_path)
     current_app.logger.info(f' UI |  Copied PDF to static path: {static_path}')
     return render_template('view_pdf.html', pdf=pdf, pdf_file_url=url_for('static', filename=pdf.original_filename))
 
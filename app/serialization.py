@@ -0,0 +1,187 @@
+"""
+Fast JSON path for list/get endpoints.
+
+Rows are selected as plain column tuples (no ORM instances), mapped to dicts by a per-model
+function built once from the table's columns, encoded in batches and streamed as one JSON array.
+The output has the same keys and values as the marshmallow auto schemas (ISO 8601 datetimes).
+"""
+import gzip
+import json
+import zlib
+from datetime import date, datetime
+
+from flask import Response, abort, current_app, request, stream_with_context
+from sqlalchemy import DateTime, Date, select
+
+from . import db
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+_row_mappers = {}
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _compile_row_mapper(columns):
+    """Build a function turning a row tuple into a dict, converting only the columns that need it."""
+    keys = tuple(column.key for column in columns)
+    converters = tuple((index, _isoformat) for index, column in enumerate(columns)
+                       if isinstance(column.type, (DateTime, Date)))
+
+    def to_dict(row):
+        if converters:
+            row = list(row)
+            for index, convert in converters:
+                row[index] = convert(row[index])
+        return dict(zip(keys, row))
+    return to_dict
+
+
+def model_columns(model):
+    """Columns of a model, in the order the auto schema exposes them."""
+    return list(model.__table__.columns)
+
+
+def row_mapper(model):
+    mapper = _row_mappers.get(model)
+    if mapper is None:
+        mapper = _row_mappers[model] = _compile_row_mapper(model_columns(model))
+    return mapper
+
+
+def select_rows(model):
+    """select() of all of a model's columns as plain tuples; add filters with .where()."""
+    return select(*model_columns(model))
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value):
+    """Encode to JSON bytes with orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(',', ':')).encode()
+
+
+def _iter_json_array(result, to_dict):
+    # Encode a whole partition at a time and drop its brackets: one encoder call per batch, not per row.
+    yield b'['
+    first = True
+    for rows in result.partitions():
+        if not first:
+            yield b','
+        yield dumps([to_dict(row) for row in rows])[1:-1]
+        first = False
+    yield b']'
+
+
+def _negotiate_encoding():
+    # The highest q-value wins and q=0 refuses an encoding ('*' covers unlisted ones); ties prefer br.
+    # Uncompressed is only chosen over both when the client ranks 'identity' explicitly higher.
+    accepted = request.accept_encodings
+    encodings = (['br'] if brotli is not None else []) + ['gzip']
+    quality, _, encoding = max((accepted.quality(name), -rank, name) for rank, name in enumerate(encodings))
+    identity = accepted.quality('identity') if any(value.lower() == 'identity' for value, _ in accepted) else 0
+    if quality <= 0 or quality < identity:
+        return None
+    return encoding
+
+
+def _compress_stream(blocks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=current_app.config['BROTLI_QUALITY'])
+        for block in blocks:
+            data = compressor.process(block)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits=31 writes a gzip header and trailer around the deflate stream.
+        compressor = zlib.compressobj(current_app.config['GZIP_LEVEL'], zlib.DEFLATED, 31)
+        for block in blocks:
+            data = compressor.compress(block)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=current_app.config['BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=current_app.config['GZIP_LEVEL'])
+
+
+def stream_json_array(statement, model):
+    """Stream the rows of a select_rows() statement as a JSON array, compressed if the client accepts it."""
+    result = db.session.execute(statement.execution_options(yield_per=current_app.config['JSON_STREAM_BATCH_SIZE']))
+    blocks = _iter_json_array(result, row_mapper(model))
+    encoding = _negotiate_encoding()
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding is not None:
+        blocks = _compress_stream(blocks, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(stream_with_context(blocks), mimetype='application/json', headers=headers)
+
+
+def json_response(value):
+    """JSON response encoded with dumps(), compressed when large enough to be worth it."""
+    body = dumps(value)
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = _negotiate_encoding()
+    if encoding is not None and len(body) >= current_app.config['COMPRESSION_MIN_SIZE']:
+        body = _compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
+
+
+def json_row_response(row, model):
+    """Response for a single row of a select_rows() statement."""
+    return json_response(row_mapper(model)(row))
+
+
+def batch_ids():
+    """IDs from a {"ids": [...]} request body, de-duplicated in order; aborts with 400 if malformed or too many."""
+    payload = request.get_json(silent=True)
+    ids = payload.get('ids') if isinstance(payload, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        abort(400, 'Body must be {"ids": [<int>, ...]}')
+    if len(ids) > current_app.config['BATCH_MAX_IDS']:
+        abort(400, f"At most {current_app.config['BATCH_MAX_IDS']} ids per request")
+    return list(dict.fromkeys(ids))
+
+
+def rows_by_id(model, ids, column=None):
+    """Fetch rows of model whose `column` (the primary key by default) is in ids, as dicts, with one IN query
+    per BATCH_MAX_IDS ids. Returns {id: [dict, ...]} when grouping by another column, else {id: dict}."""
+    column = model.id if column is None else column
+    to_dict = row_mapper(model)
+    found = {}
+    size = current_app.config['BATCH_MAX_IDS']
+    for start in range(0, len(ids), size):
+        statement = select_rows(model).where(column.in_(ids[start:start + size])).order_by(model.id)
+        for row in db.session.execute(statement):
+            document = to_dict(row)
+            if column is model.id:
+                found[document['id']] = document
+            else:
+                found.setdefault(document[column.key], []).append(document)
+    return found
+
+
+def batch_response(ids, found):
+    """{"results": {id: document or {"error": "not found"}}} in request order."""
+    return json_response({'results': {str(i): found.get(i, {'error': 'not found'}) for i in ids}})
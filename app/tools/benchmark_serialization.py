@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the list endpoint serialisation paths.
+
+Inserts synthetic PDF rows inside a transaction that is rolled back afterwards, then times
+query + serialise for the marshmallow path (ORM query, PDFSchema.dump(many=True), json.dumps)
+against the fast path (column select, precompiled row mapper, batched encoder), and checks
+that both produce the same documents.
+
+Usage:
+    python -m app.tools.benchmark_serialization --rows 20000 --repeat 5
+"""
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+
+from .. import app, db
+from ..models.documents import PDF, PDFSchema
+from ..serialization import _iter_json_array, orjson, row_mapper, select_rows
+
+
+def _insert_rows(count):
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    db.session.execute(PDF.__table__.insert(), [{
+        'original_filename': f"benchmark-{i}.pdf",
+        'name_key': f"benchmark-{i}.pdf",
+        'stored_path': f"/benchmark/benchmark-{i}/benchmark-{i}.pdf",
+        'sys_metadata': {'author': f"Author {i % 97}", 'pages': i % 500, 'tags': ['report', str(i % 7)]},
+        'checksum': f"{i:064x}",
+        'uploaded_at': start + timedelta(seconds=i),
+        'current_version': 1 + i % 3
+    } for i in range(count)])
+
+
+def _marshmallow_path():
+    return json.dumps(PDFSchema().dump(PDF.query.order_by(PDF.id).all(), many=True)).encode()
+
+
+def _fast_path(batch_size):
+    statement = select_rows(PDF).order_by(PDF.id).execution_options(yield_per=batch_size)
+    return b''.join(_iter_json_array(db.session.execute(statement), row_mapper(PDF)))
+
+
+def _best_of(repeat, func):
+    timings = []
+    body = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        body = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), body
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare marshmallow and fast-path JSON serialisation of PDFs.')
+    parser.add_argument('--rows', type=int, default=20000, help='Synthetic rows to insert (rolled back afterwards)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per path; the best time is reported')
+    parser.add_argument('--batch-size', type=int, default=app.config['JSON_STREAM_BATCH_SIZE'])
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        try:
+            _insert_rows(args.rows)
+            total = db.session.query(PDF).count()
+            slow_seconds, slow_body = _best_of(args.repeat, _marshmallow_path)
+            fast_seconds, fast_body = _best_of(args.repeat, lambda: _fast_path(args.batch_size))
+        finally:
+            db.session.rollback()
+
+    if json.loads(slow_body) != json.loads(fast_body):
+        raise SystemExit('Fast path output differs from PDFSchema.dump(many=True)')
+    print(f"rows:        {total} (encoder: {'orjson' if orjson is not None else 'json'})")
+    print(f"marshmallow: {slow_seconds * 1000:9.1f} ms  {total / slow_seconds:10.0f} rows/s  {len(slow_body)} bytes")
+    print(f"fast path:   {fast_seconds * 1000:9.1f} ms  {total / fast_seconds:10.0f} rows/s  {len(fast_body)} bytes")
+    print(f"speedup:     {slow_seconds / fast_seconds:9.1f}x")
+    print(f"gzip:        {len(gzip.compress(fast_body, compresslevel=app.config['GZIP_LEVEL']))} bytes")
+
+
+if __name__ == "__main__":
+    main()
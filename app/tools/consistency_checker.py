@@ -0,0 +1,417 @@
+"""
+Storage / database consistency checker and integrity scrubber.
+
+Walks the pdfs and attachments tables in keyset batches, compares each batch against bulk
+directory listings of the storage backend and reports (or repairs) drift:
+
+    missing_file       a row whose stored file does not exist
+    orphan_file        a stored file that no row references
+    orphan_directory   a document directory that no PDF row lives in (batch mode only)
+    missing_chunk      a PDF version whose manifest references a chunk with no chunks row
+    missing_chunk_file a chunks row whose file does not exist (batch mode only)
+    orphan_chunk       a file in a chunk store directory that no chunks row references (batch mode only)
+    checksum_mismatch  a stored file whose SHA-256 differs from the recorded checksum
+    checksum_missing   a row without a recorded checksum (backfilled with --repair)
+    listing_failed     a batch skipped because a storage listing failed (never repaired)
+
+Usage:
+    python -m app.tools.consistency_checker --mode batch --verify-checksums --report drift.jsonl
+    python -m app.tools.consistency_checker --mode incremental --repair
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from .. import app, db, file_manager
+from ..config import Config
+from ..file_systems.checksum import sha256_file
+from ..file_systems.logger import AppLogger
+from ..models.changes import record_change
+from ..models.documents import PDF, Attachment
+from ..models.versions import Chunk, DocumentVersion
+from ..versions import chunk_path
+
+
+class ListingFailed(Exception):
+    """A storage listing failed for a reason other than the path not existing."""
+
+
+def _is_dir(status):
+    return bool(status.get('is_dir')) or status.get('type') == 'DIRECTORY'
+
+
+def _mtime(status):
+    # Local and S3 listings report seconds, WebHDFS reports milliseconds.
+    if status.get('mtime') is not None:
+        return status['mtime']
+    if status.get('modificationTime') is not None:
+        return status['modificationTime'] / 1000
+    return None
+
+
+class ConsistencyChecker:
+    def __init__(self, workers=16, batch_size=1000, grace_seconds=600, verify_checksums=False, repair=False,
+                 report_path=None):
+        """
+        :param workers: Number of parallel storage listing / checksum workers
+        :param batch_size: Number of rows fetched per keyset batch
+        :param grace_seconds: Rows and files younger than this are skipped, so in-flight uploads are not flagged
+        :param verify_checksums: Re-hash stored files and compare against the recorded checksum
+        :param repair: Delete orphan rows and files and backfill missing checksums instead of only reporting
+        :param report_path: Optional JSON lines file receiving one entry per issue found
+        """
+        self.workers = workers
+        self.batch_size = batch_size
+        self.grace_seconds = grace_seconds
+        self.verify_checksums = verify_checksums
+        self.repair = repair
+        self.report_path = report_path
+        self.parent = Config.PARENT_DIRECTORY.rstrip('/')
+        self.counts = Counter()
+        self.logger = AppLogger(name="ConsistencyChecker", prefix=" | CONSISTENCY | ").get_logger()
+        self._report_file = None
+        self._cutoff = None
+
+    # Reporting
+
+    def _report(self, kind, **details):
+        self.counts[kind] += 1
+        self.logger.warning(f"{kind}: {details}")
+        if self._report_file is not None:
+            self._report_file.write(json.dumps({'kind': kind, **details}, default=str) + '\n')
+
+    # Storage helpers (run in worker threads, never touch the database)
+
+    def _list(self, path):
+        """Return the listing of path, or None if it does not exist. Any other error raises ListingFailed:
+        a timeout must not look like a missing directory, or every row in it would be reported and repaired."""
+        try:
+            return file_manager.list_directory(path, status=True)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            raise ListingFailed(f"{path}: {e}") from e
+
+    def _list_document_dir(self, directory):
+        """Return {path: status} for every file in a document directory and its attachments
+        directory, or None if the directory does not exist."""
+        entries = self._list(directory)
+        if entries is None:
+            return None
+        files = {}
+        for name, status in entries:
+            if name == 'attachments' and _is_dir(status):
+                for sub_name, sub_status in self._list(f"{directory}/attachments") or []:
+                    if not _is_dir(sub_status):
+                        files[f"{directory}/attachments/{sub_name}"] = sub_status
+            elif not _is_dir(status):
+                files[f"{directory}/{name}"] = status
+        return files
+
+    def _hash(self, target):
+        """Hash a stored file, or a versioned document given its manifest (list of chunk hashes)."""
+        if isinstance(target, list):
+            try:
+                digest = hashlib.sha256()
+                for chunk_hash in target:
+                    digest.update(file_manager.read_bytes(chunk_path(chunk_hash)))
+                return digest.hexdigest()
+            except Exception as e:
+                self.logger.error(f"Failed to hash chunks {target[:1]}...: {e}")
+                return None
+        path = target
+        fd, local_path = tempfile.mkstemp(dir=Config.TMP_DIRECTORY, prefix='scrub-')
+        os.close(fd)
+        try:
+            file_manager.download_file(src_path=path, local_path=local_path)
+            return sha256_file(local_path)
+        except Exception as e:
+            self.logger.error(f"Failed to hash {path}: {e}")
+            return None
+        finally:
+            if os.path.exists(local_path):
+                os.remove(local_path)
+
+    # Row checks
+
+    def _is_recent(self, status):
+        mtime = _mtime(status)
+        return mtime is not None and mtime > time.time() - self.grace_seconds
+
+    def _check_rows(self, pool, pdfs, attachments, orphan_scan):
+        """Check a batch of rows against one listing per document directory."""
+        rows = list(pdfs) + list(attachments)
+        directories = sorted({pdf.stored_path.rsplit('/', 1)[0] for pdf in pdfs} |
+                             {a.stored_path.rsplit('/', 2)[0] for a in attachments})
+        # Raises ListingFailed before any row is judged, so a failed listing never reaches repair.
+        listings = dict(zip(directories, pool.map(self._list_document_dir, directories)))
+        files = {}
+        for listing in listings.values():
+            files.update(listing or {})
+
+        # Versioned PDFs live in the chunk store; their stored_path is only a logical name.
+        versioned = {pdf.id: pdf for pdf in pdfs if pdf.current_version is not None}
+        manifests = self._check_manifests(versioned)
+
+        present = []
+        for row in rows:
+            table = row.__tablename__
+            if table == 'pdfs' and row.id in versioned:
+                if row.id in manifests:
+                    present.append(row)
+            elif row.stored_path not in files:
+                self._report('missing_file', table=table, id=row.id, path=row.stored_path)
+                if self.repair:
+                    self._delete_row(row)
+            else:
+                present.append(row)
+
+        if orphan_scan:
+            referenced = {row.stored_path for row in rows}
+            candidates = [path for path, status in files.items()
+                          if path not in referenced and not self._is_recent(status)]
+            if candidates:
+                # Until app.tools.storage_layout has run, a directory can be shared by documents outside
+                # this batch (e.g. 'a.pdf' and 'a.png'), so confirm candidates against the database.
+                known = {p for (p,) in db.session.query(PDF.stored_path).filter(PDF.stored_path.in_(candidates))}
+                known |= {p for (p,) in db.session.query(Attachment.stored_path)
+                          .filter(Attachment.stored_path.in_(candidates))}
+                for path in candidates:
+                    if path not in known:
+                        self._report('orphan_file', path=path)
+                        if self.repair:
+                            file_manager.delete_directory(path)
+
+        for row in present:
+            if row.checksum is None:
+                self._report('checksum_missing', table=row.__tablename__, id=row.id, path=row.stored_path)
+        if self.verify_checksums:
+            targets = [row for row in present if row.checksum or self.repair]
+            sources = [manifests[row.id] if row.__tablename__ == 'pdfs' and row.id in versioned else row.stored_path
+                       for row in targets]
+            for row, digest in zip(targets, pool.map(self._hash, sources)):
+                if digest is None:
+                    continue
+                if row.checksum is None:
+                    row.checksum = digest
+                elif row.checksum != digest:
+                    self._report('checksum_mismatch', table=row.__tablename__, id=row.id, path=row.stored_path,
+                                 expected=row.checksum, actual=digest)
+
+        self.counts['rows_checked'] += len(rows)
+        self.counts['directories_listed'] += len(directories)
+        db.session.commit()
+        db.session.expunge_all()
+        return set(directories)
+
+    def _check_manifests(self, versioned):
+        """Report versions referencing unknown chunks; return {pdf_id: manifest of the current version}
+        for documents whose current version is complete."""
+        if not versioned:
+            return {}
+        versions = DocumentVersion.query.filter(DocumentVersion.pdf_id.in_(list(versioned))).all()
+        hashes = sorted({h for version in versions for h in version.chunks})
+        known = set()
+        for start in range(0, len(hashes), 500):
+            known.update(h for (h,) in db.session.query(Chunk.hash).filter(Chunk.hash.in_(hashes[start:start + 500])))
+        manifests = {}
+        for version in versions:
+            missing = [h for h in version.chunks if h not in known]
+            for chunk_hash in missing:
+                self._report('missing_chunk', pdf_id=version.pdf_id, version=version.version, hash=chunk_hash)
+            if not missing and version.version == versioned[version.pdf_id].current_version:
+                manifests[version.pdf_id] = list(version.chunks)
+        return manifests
+
+    def _check_chunk_store(self, pool):
+        """Compare the chunks table against listings of the chunk store directories."""
+        scanned = set()
+        after = ''
+        while True:
+            # Rows with ref_count 0 are awaiting garbage collection; their file may already be gone.
+            hashes = [h for (h,) in db.session.query(Chunk.hash)
+                      .filter(Chunk.hash > after, Chunk.created_at <= self._cutoff, Chunk.ref_count > 0)
+                      .order_by(Chunk.hash)
+                      .limit(self.batch_size)]
+            if not hashes:
+                return
+            after = hashes[-1]
+            directories = sorted({chunk_path(h).rsplit('/', 1)[0] for h in hashes})
+            try:
+                listings = dict(zip(directories, pool.map(self._list, directories)))
+            except ListingFailed as e:
+                self._report('listing_failed', chunks_after=hashes[0], error=str(e))
+                continue
+            stored = {name for entries in listings.values() for name, _ in entries or []}
+            for chunk_hash in hashes:
+                if chunk_hash not in stored:
+                    self._report('missing_chunk_file', hash=chunk_hash, path=chunk_path(chunk_hash))
+            candidates = {}
+            for directory in directories:
+                if directory in scanned:
+                    continue
+                scanned.add(directory)
+                for name, status in listings[directory] or []:
+                    if not _is_dir(status) and not self._is_recent(status):
+                        candidates[name] = f"{directory}/{name}"
+            batch = set(hashes)
+            candidates = {name: path for name, path in candidates.items() if name not in batch}
+            names = list(candidates)
+            for start in range(0, len(names), 500):
+                for (known,) in db.session.query(Chunk.hash).filter(Chunk.hash.in_(names[start:start + 500])):
+                    candidates.pop(known, None)
+            for path in candidates.values():
+                self._report('orphan_chunk', path=path)
+                if self.repair:
+                    file_manager.delete_directory(path)
+            self.counts['chunks_checked'] += len(hashes)
+
+    def _delete_row(self, row):
+        if isinstance(row, PDF):
+            for attachment in row.attachments:
+                try:
+                    file_manager.delete_directory(attachment.stored_path)
+                except Exception as e:
+                    self.logger.error(f"Failed to delete attachment file {attachment.stored_path}: {e}")
+                record_change('delete', attachment)
+        record_change('delete', row)
+        db.session.delete(row)
+
+    # Keyset iteration
+
+    def _batches(self, model, after_id=0):
+        while True:
+            rows = (model.query
+                    .filter(model.id > after_id, model.uploaded_at <= self._cutoff)
+                    .order_by(model.id)
+                    .limit(self.batch_size)
+                    .all())
+            if not rows:
+                return
+            after_id = rows[-1].id
+            yield rows, after_id
+
+    # Modes
+
+    def run_batch(self):
+        """Full pass: every row, every file, every document directory."""
+        self._cutoff = datetime.utcnow() - timedelta(seconds=self.grace_seconds)
+        visited = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for pdfs, _ in self._batches(PDF):
+                pdf_ids = [pdf.id for pdf in pdfs]
+                attachments = Attachment.query.filter(Attachment.pdf_id.in_(pdf_ids),
+                                                      Attachment.uploaded_at <= self._cutoff).all()
+                try:
+                    visited |= self._check_rows(pool, pdfs, attachments, orphan_scan=True)
+                except ListingFailed as e:
+                    self._report('listing_failed', pdf_ids=[pdf_ids[0], pdf_ids[-1]], error=str(e))
+                    # Not checked, but not orphaned either.
+                    visited |= {pdf.stored_path.rsplit('/', 1)[0] for pdf in pdfs}
+                    db.session.rollback()
+                    db.session.expunge_all()
+                self.logger.info(f"Checked PDFs up to ID {pdf_ids[-1]} ({dict(self.counts)})")
+            self._check_chunk_store(pool)
+
+        try:
+            entries = self._list(self.parent) or []
+        except ListingFailed as e:
+            self._report('listing_failed', path=self.parent, error=str(e))
+            entries = []
+        for name, status in entries:
+            directory = f"{self.parent}/{name}"
+            if not _is_dir(status) or directory in visited or self._is_recent(status):
+                continue
+            if PDF.query.filter(PDF.stored_path.startswith(f"{directory}/")).first() is not None:
+                continue
+            # The PDF itself may have been moved to the archive tier while its attachments stayed.
+            if Attachment.query.filter(Attachment.stored_path.startswith(f"{directory}/")).first() is not None:
+                continue
+            self._report('orphan_directory', path=directory)
+            if self.repair:
+                file_manager.delete_directory(directory)
+        return self.counts
+
+    def run_incremental(self, state_path):
+        """Check only rows created since the previous incremental run. A failed listing stops the run
+        (ListingFailed) with the cursor left before the failed batch, so it is retried next time."""
+        state = {'last_pdf_id': 0, 'last_attachment_id': 0}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state.update(json.load(f))
+        self._cutoff = datetime.utcnow() - timedelta(seconds=self.grace_seconds)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for pdfs, last_id in self._batches(PDF, state['last_pdf_id']):
+                    self._check_rows(pool, pdfs, [], orphan_scan=False)
+                    state['last_pdf_id'] = last_id
+                    self._save_state(state_path, state)
+                for attachments, last_id in self._batches(Attachment, state['last_attachment_id']):
+                    self._check_rows(pool, [], attachments, orphan_scan=False)
+                    state['last_attachment_id'] = last_id
+                    self._save_state(state_path, state)
+            except ListingFailed as e:
+                db.session.rollback()
+                self._report('listing_failed', state=dict(state), error=str(e))
+                self.logger.error("Stopping incremental check; the failed batch is retried on the next run")
+        return self.counts
+
+    @staticmethod
+    def _save_state(state_path, state):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def run(self, mode, state_path=None):
+        self.logger.info(f"Starting {mode} consistency check (repair={self.repair}, "
+                         f"verify_checksums={self.verify_checksums}, workers={self.workers})")
+        started = time.time()
+        self._report_file = open(self.report_path, 'a') if self.report_path else None
+        try:
+            if mode == 'incremental':
+                self.run_incremental(state_path)
+            else:
+                self.run_batch()
+        finally:
+            if self._report_file is not None:
+                self._report_file.close()
+        summary = dict(self.counts, elapsed_seconds=round(time.time() - started, 2))
+        self.logger.info(f"Finished {mode} consistency check: {summary}")
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find and repair drift between the database and file storage.')
+    parser.add_argument('--mode', choices=['batch', 'incremental'], default='batch')
+    parser.add_argument('--state-file', default=os.path.join(Config.LOG_DIRECTORY, 'consistency_state.json'),
+                        help='Cursor file used by incremental mode')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--grace-seconds', type=int, default=600)
+    parser.add_argument('--verify-checksums', action='store_true')
+    parser.add_argument('--repair', action='store_true')
+    parser.add_argument('--report', default=None, help='Append issues as JSON lines to this file')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        checker = ConsistencyChecker(
+            workers=args.workers,
+            batch_size=args.batch_size,
+            grace_seconds=args.grace_seconds,
+            verify_checksums=args.verify_checksums,
+            repair=args.repair,
+            report_path=args.report
+        )
+        summary = checker.run(args.mode, state_path=args.state_file)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Move documents stored under the legacy directory layout to their own directories.
+
+Earlier releases stored a PDF and its attachments under PARENT_DIRECTORY/<filename up to the first
+dot>, so 'a.pdf' and 'a.png' shared a directory and deleting one deleted the other's attachments.
+Documents now live under document_directory(PARENT_DIRECTORY, name_key). This tool moves every
+file still in a legacy directory to the new one and repoints its row; versioned PDFs, whose
+stored_path is only a logical name, just get the new name. Archived files stay in the archive and
+are restored to the new directory. Rows are handled one document at a time, so the tool can be
+interrupted and re-run. The emptied legacy directories are left to
+`app.tools.consistency_checker --mode batch --repair` (orphan_directory).
+
+Usage:
+    python -m app.tools.storage_layout --dry-run
+    python -m app.tools.storage_layout
+"""
+import argparse
+import json
+from collections import Counter
+
+from sqlalchemy import update
+
+from .. import app, db, file_manager
+from ..config import Config
+from ..file_systems.logger import AppLogger
+from ..models.access import DocumentAccess
+from ..models.documents import PDF, Attachment, document_directory
+
+
+def legacy_directory(parent, filename):
+    """Directory a document was stored in before document_directory()."""
+    return f"{parent}/{filename.split('.')[0]}"
+
+
+class StorageLayoutMigration:
+    def __init__(self, batch_size=1000, dry_run=False):
+        """
+        :param batch_size: Number of PDFs fetched per keyset batch
+        :param dry_run: Only log the moves that would be made
+        """
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.parent = Config.PARENT_DIRECTORY.rstrip('/')
+        self.counts = Counter()
+        self.logger = AppLogger(name="StorageLayout", prefix=" | STORAGE_LAYOUT | ").get_logger()
+
+    def _rows(self, pdf):
+        """(entity, row, DocumentAccess if archived, new path) for the PDF and each attachment still in the
+        legacy directory. An archived row counts by the path it is restored to."""
+        old = legacy_directory(self.parent, pdf.original_filename)
+        new = document_directory(self.parent, pdf.name_key)
+        accesses = {(access.entity, access.entity_id): access for access in DocumentAccess.query.filter(
+            ((DocumentAccess.entity == 'pdf') & (DocumentAccess.entity_id == pdf.id)) |
+            ((DocumentAccess.entity == 'attachment') &
+             DocumentAccess.entity_id.in_([attachment.id for attachment in pdf.attachments])))}
+        rows = []
+        for entity, row in [('pdf', pdf)] + [('attachment', attachment) for attachment in pdf.attachments]:
+            access = accesses.get((entity, row.id))
+            archived = access is not None and access.archived_from is not None
+            path = access.archived_from if archived else row.stored_path
+            if path.startswith(f"{old}/") and old != new:
+                rows.append((entity, row, access if archived else None, f"{new}/{path[len(old) + 1:]}"))
+        return rows
+
+    def _migrate_row(self, entity, row, archived, target):
+        if archived is not None:
+            # The file stays in the archive; the tiering policy restores it to the new path.
+            self.logger.info(f"{entity} {row.id}: archived, restore path {archived.archived_from} -> {target}")
+            if not self.dry_run:
+                archived.archived_from = target
+            self.counts['archived_repointed'] += 1
+            return
+        src = row.stored_path
+        self.logger.info(f"{entity} {row.id}: {src} -> {target}")
+        if self.dry_run:
+            self.counts['moved'] += 1
+            return
+        if file_manager.exists(src):
+            file_manager.create_directory(target.rsplit('/', 1)[0])
+            file_manager.rename(src, target)
+            self.counts['moved'] += 1
+        elif entity == 'pdf' and row.current_version is not None:
+            self.counts['renamed'] += 1
+        elif file_manager.exists(target):
+            self.counts['moved'] += 1  # moved by an interrupted run
+        else:
+            self.logger.warning(f"{entity} {row.id}: {src} does not exist, left for the consistency checker")
+            self.counts['missing'] += 1
+            return
+        model = PDF if entity == 'pdf' else Attachment
+        result = db.session.execute(update(model).where(model.id == row.id, model.stored_path == src)
+                                    .values(stored_path=target))
+        if result.rowcount == 0:
+            # Replaced by an upload meanwhile: the moved file is an obsolete revision.
+            file_manager.delete_directory(target)
+            self.logger.warning(f"{entity} {row.id}: {src} was replaced during the move")
+
+    def run(self):
+        after_id = 0
+        while True:
+            pdfs = PDF.query.filter(PDF.id > after_id).order_by(PDF.id).limit(self.batch_size).all()
+            if not pdfs:
+                break
+            after_id = pdfs[-1].id
+            for pdf in pdfs:
+                try:
+                    for entity, row, archived, target in self._rows(pdf):
+                        self._migrate_row(entity, row, archived, target)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    self.logger.error(f"pdf {pdf.id}: migration failed: {e}")
+                    self.counts['failed'] += 1
+                self.counts['documents_checked'] += 1
+            db.session.expunge_all()
+            self.logger.info(f"Migrated PDFs up to ID {after_id} ({dict(self.counts)})")
+        return dict(self.counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move documents from the legacy shared directories to their own.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='Only log the moves that would be made')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        summary = StorageLayoutMigration(batch_size=args.batch_size, dry_run=args.dry_run).run()
+        print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Access-driven replication and hot/cold tiering.
+
+Classifies every PDF and attachment from its decayed read count (see app.access) and how long
+it has been idle:
+
+    hot      recent reads >= TIERING_HOT_READS        replication TIERING_HOT_REPLICATION
+    warm     everything else                          replication TIERING_DEFAULT_REPLICATION
+    cold     idle for TIERING_COLD_AFTER_DAYS         replication TIERING_COLD_REPLICATION
+    archive  idle for TIERING_ARCHIVE_AFTER_DAYS      moved under TIERING_ARCHIVE_DIRECTORY, cold replication
+
+and applies the difference to storage. A chunk shared by several PDFs gets the highest replication
+any of its documents needs; chunks only used by older versions get cold replication. Chunks are
+content-addressed and shared, so only documents with a file of their own (attachments and PDFs
+stored before versioning) are moved to the archive. An archived document that is read again
+is moved back on the next run.
+
+Every tier change is logged, written to the tiering_decisions table and the optional report,
+and served by GET /api/admin/tiering.
+
+Usage:
+    python -m app.tools.tiering_policy --dry-run --report tiering.jsonl
+    python -m app.tools.tiering_policy --loop 3600
+"""
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import and_, case, delete, func, or_, select, true, update
+
+from .. import app, db, file_manager
+from ..config import Config
+from ..file_systems.logger import AppLogger
+from ..models.access import DocumentAccess, TieringDecision
+from ..models.documents import PDF, Attachment
+from ..models.versions import Chunk, DocumentVersion
+from ..versions import chunk_path
+
+ENTITIES = {'pdf': PDF, 'attachment': Attachment}
+
+
+class TieringPolicy:
+    def __init__(self, workers=16, batch_size=1000, dry_run=False, report_path=None):
+        """
+        :param workers: Number of parallel storage calls (set_replication, moves)
+        :param batch_size: Number of documents or chunks handled per batch
+        :param dry_run: Log and report decisions without changing storage or the database
+        :param report_path: Optional JSON lines file receiving one entry per decision
+        """
+        self.workers = workers
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.report_path = report_path
+        self.archive = Config.TIERING_ARCHIVE_DIRECTORY.rstrip('/')
+        self.replication = {
+            'hot': Config.TIERING_HOT_REPLICATION,
+            'warm': Config.TIERING_DEFAULT_REPLICATION,
+            'cold': Config.TIERING_COLD_REPLICATION,
+            'archive': Config.TIERING_COLD_REPLICATION
+        }
+        self.replication_supported = True
+        self.counts = Counter()
+        self.logger = AppLogger(name="TieringPolicy", prefix=" | TIERING | ").get_logger()
+        self._report_file = None
+        self._now = None
+
+    # Reporting
+
+    def _report(self, decision):
+        self.counts[f"to_{decision['to_tier']}"] += 1
+        log = self.logger.error if decision.get('error') else self.logger.info
+        log(f"{decision['entity']} {decision['entity_id']}: {decision['from_tier']} -> {decision['to_tier']} "
+            f"({decision['reason']}), replication={decision['replication']}, files_changed={decision['files_changed']}"
+            + (f", moved to {decision['moved_to']}" if decision.get('moved_to') else '')
+            + (f", error: {decision['error']}" if decision.get('error') else ''))
+        if self._report_file is not None:
+            self._report_file.write(json.dumps(decision, default=str) + '\n')
+        if not self.dry_run:
+            db.session.add(TieringDecision(**decision))
+
+    # Classification
+
+    def _classify(self, access, uploaded_at, can_archive):
+        """Return (tier, reason) for a document; decays its recent read count as a side effect."""
+        recent = 0.0
+        idle_since = uploaded_at
+        if access is not None:
+            # Rows flushed before decayed_at was recorded decay from their last read.
+            decayed_at = access.decayed_at or access.last_read_at or self._now
+            half_lives = max((self._now - decayed_at).total_seconds(), 0) / (Config.TIERING_HALF_LIFE_HOURS * 3600)
+            factor = 0.5 ** half_lives
+            recent = access.recent_reads * factor
+            if not self.dry_run and (factor < 1 or access.decayed_at is None):
+                # Decay in SQL so reads flushed by the app since we loaded the row are not lost.
+                access.recent_reads = DocumentAccess.recent_reads * factor
+                access.decayed_at = self._now
+            idle_since = access.last_read_at or uploaded_at
+        idle_days = (self._now - idle_since).total_seconds() / 86400 if idle_since else 0
+        if recent >= Config.TIERING_HOT_READS:
+            return 'hot', f"{recent:.1f} recent reads"
+        if can_archive and Config.TIERING_ARCHIVE_AFTER_DAYS > 0 and idle_days >= Config.TIERING_ARCHIVE_AFTER_DAYS:
+            return 'archive', f"idle {idle_days:.0f} days"
+        if idle_days >= Config.TIERING_COLD_AFTER_DAYS:
+            return 'cold', f"idle {idle_days:.0f} days"
+        return 'warm', f"{recent:.1f} recent reads, idle {idle_days:.0f} days"
+
+    # Storage effects
+
+    def _set_replication(self, pool, paths, replication):
+        """Set the replication factor of paths; return (number changed, error or None)."""
+        if not self.replication_supported or not paths:
+            return 0, None
+
+        def apply(path):
+            try:
+                file_manager.set_replication(path, replication)
+                return None
+            except NotImplementedError:
+                raise
+            except Exception as e:
+                return f"{path}: {e}"
+        try:
+            errors = [error for error in pool.map(apply, paths) if error is not None]
+        except NotImplementedError:
+            self.replication_supported = False
+            self.logger.warning("Storage backend has no replication factor; only archive moves are applied")
+            return 0, None
+        return len(paths) - len(errors), errors[0] if errors else None
+
+    def _move(self, model, row, src, dst):
+        """Move a document's file and repoint its row. Safe to re-run after a crash between the two steps."""
+        if file_manager.exists(src):
+            file_manager.create_directory(dst.rsplit('/', 1)[0])
+            file_manager.rename(src, dst)
+        elif not file_manager.exists(dst):
+            raise FileNotFoundError(src)
+        result = db.session.execute(update(model).where(model.id == row.id, model.stored_path == src)
+                                    .values(stored_path=dst))
+        if result.rowcount == 0:
+            # Replaced by an upload meanwhile: the moved file is an obsolete revision.
+            file_manager.delete_directory(dst)
+            raise RuntimeError(f"{src} was replaced during the move")
+
+    def _apply_file_document(self, pool, entity, row, access, tier, reason):
+        """Apply a tier to a document stored as a single file (attachment or pre-versioning PDF)."""
+        model = ENTITIES[entity]
+        current = access.tier if access is not None else 'warm'
+        replication = self.replication[tier]
+        applied_replication = access.replication if access is not None else None
+        if tier == current and (applied_replication == replication or
+                                (applied_replication is None and (tier == 'warm' or not self.replication_supported))):
+            return
+        decision = {'entity': entity, 'entity_id': row.id, 'from_tier': current, 'to_tier': tier,
+                    'reason': reason, 'replication': replication, 'files_changed': 0,
+                    'moved_from': None, 'moved_to': None, 'applied': False, 'error': None}
+        path = row.stored_path
+        if not self.dry_run:
+            if access is None:
+                access = DocumentAccess(entity=entity, entity_id=row.id, reads=0, recent_reads=0.0, tier='warm')
+                db.session.add(access)
+            try:
+                if tier == 'archive' and access.archived_from is None:
+                    target = f"{self.archive}/{path.lstrip('/')}"
+                    self._move(model, row, path, target)
+                    decision.update(moved_from=path, moved_to=target)
+                    access.archived_from, path = path, target
+                elif tier != 'archive' and access.archived_from is not None:
+                    self._move(model, row, path, access.archived_from)
+                    decision.update(moved_from=path, moved_to=access.archived_from)
+                    path, access.archived_from = access.archived_from, None
+            except Exception as e:
+                decision['error'] = f"move failed: {e}"
+            if decision['error'] is None:
+                decision['files_changed'], decision['error'] = self._set_replication(pool, [path], replication)
+                if not self.replication_supported:
+                    decision['replication'] = None
+                if decision['error'] is None:
+                    access.tier = tier
+                    access.tiered_at = self._now
+                    access.replication = decision['replication']
+                    decision['applied'] = True
+            if tier == current and decision['moved_to'] is None and not self.replication_supported:
+                return  # nothing this backend can change
+        self._report(decision)
+
+    # Passes
+
+    def _accesses(self, entity, ids):
+        return {access.entity_id: access for access in
+                DocumentAccess.query.filter(DocumentAccess.entity == entity, DocumentAccess.entity_id.in_(ids))}
+
+    def _batches(self, model):
+        after_id = 0
+        while True:
+            rows = model.query.filter(model.id > after_id).order_by(model.id).limit(self.batch_size).all()
+            if not rows:
+                return
+            after_id = rows[-1].id
+            yield rows
+
+    def _pdf_pass(self, pool):
+        for pdfs in self._batches(PDF):
+            ids = [pdf.id for pdf in pdfs]
+            accesses = self._accesses('pdf', ids)
+            for pdf in pdfs:
+                access = accesses.get(pdf.id)
+                tier, reason = self._classify(access, pdf.uploaded_at, can_archive=pdf.current_version is None)
+                if pdf.current_version is None:
+                    self._apply_file_document(pool, 'pdf', pdf, access, tier, reason)
+                    continue
+                current = access.tier if access is not None else 'warm'
+                if tier != current:
+                    if not self.dry_run:
+                        if access is None:
+                            access = DocumentAccess(entity='pdf', entity_id=pdf.id, reads=0, recent_reads=0.0)
+                            db.session.add(access)
+                        access.tier = tier
+                        access.tiered_at = self._now
+                    # The chunk pass applies the replication change.
+                    replication = self.replication[tier] if self.replication_supported else None
+                    self._report({'entity': 'pdf', 'entity_id': pdf.id, 'from_tier': current, 'to_tier': tier,
+                                  'reason': reason, 'replication': replication, 'files_changed': 0,
+                                  'moved_from': None, 'moved_to': None, 'applied': not self.dry_run, 'error': None})
+            self._commit()
+            self.counts['pdfs_checked'] += len(pdfs)
+
+    def _attachment_pass(self, pool):
+        for attachments in self._batches(Attachment):
+            accesses = self._accesses('attachment', [attachment.id for attachment in attachments])
+            for attachment in attachments:
+                access = accesses.get(attachment.id)
+                tier, reason = self._classify(access, attachment.uploaded_at, can_archive=True)
+                self._apply_file_document(pool, 'attachment', attachment, access, tier, reason)
+            self._commit()
+            self.counts['attachments_checked'] += len(attachments)
+
+    def _chunk_targets(self, connection):
+        """Yield batches of (chunk hash, replication) computed by the database from the version manifests:
+        the PDF's tier replication for chunks of its current version, cold replication for older versions,
+        the highest for chunks shared by several. Streamed on PostgreSQL, so the run never holds every hash in memory."""
+        if connection.dialect.name == 'postgresql':
+            elements = func.json_array_elements_text(DocumentVersion.chunks)
+        else:
+            elements = func.json_each(DocumentVersion.chunks)
+        element = elements.table_valued('value').alias('element')
+        tier_replication = case(self.replication, value=func.coalesce(DocumentAccess.tier, 'warm'),
+                                else_=self.replication['warm'])
+        target = func.max(case((DocumentVersion.version == PDF.current_version, tier_replication),
+                               else_=self.replication['cold']))
+        statement = (select(element.c.value, target)
+                     .select_from(DocumentVersion)
+                     .join(PDF, PDF.id == DocumentVersion.pdf_id)
+                     .outerjoin(DocumentAccess, and_(DocumentAccess.entity == 'pdf',
+                                                     DocumentAccess.entity_id == PDF.id))
+                     .join(element, true())
+                     .group_by(element.c.value))
+        if connection.dialect.name != 'postgresql':
+            # An open SQLite cursor would block the commits of the chunk pass; read the result first.
+            rows = connection.execute(statement).all()
+            for start in range(0, len(rows), self.batch_size):
+                yield rows[start:start + self.batch_size]
+            return
+        yield from connection.execution_options(yield_per=self.batch_size).execute(statement).partitions()
+
+    def _chunk_pass(self, pool):
+        """Give every chunk the highest replication needed by the documents referencing it.
+
+        Chunks created since the run started are skipped: their documents were classified before
+        they existed, the next run handles them. A dry run sees the tiers stored by the previous run."""
+        if not self.replication_supported:
+            return
+        # A connection of its own: the batches below commit while the targets are still streaming.
+        with db.session.get_bind(mapper=DocumentVersion).connect() as connection:
+            for batch in self._chunk_targets(connection):
+                targets = dict(batch)
+                rows = (db.session.query(Chunk.hash, Chunk.replication)
+                        .filter(Chunk.hash.in_(list(targets)),
+                                or_(Chunk.created_at.is_(None), Chunk.created_at <= self._now)).all())
+                changes = defaultdict(list)
+                for chunk_hash, replication in rows:
+                    if (replication or self.replication['warm']) != targets[chunk_hash]:
+                        changes[targets[chunk_hash]].append(chunk_hash)
+                for target, hashes in changes.items():
+                    self.counts['chunks_to_change'] += len(hashes)
+                    if self.dry_run:
+                        continue
+                    changed, error = self._set_replication(pool, [chunk_path(h) for h in hashes], target)
+                    if not self.replication_supported:
+                        return
+                    if error is not None:
+                        self.logger.error(f"Failed to set replication {target} on {len(hashes) - changed} chunks: {error}")
+                        continue
+                    db.session.execute(update(Chunk).where(Chunk.hash.in_(hashes)).values(replication=target))
+                    self.counts['chunks_changed'] += changed
+                self._commit()
+
+    def _remove_stale_counters(self):
+        for entity, model in ENTITIES.items():
+            result = db.session.execute(delete(DocumentAccess).where(
+                DocumentAccess.entity == entity, DocumentAccess.entity_id.not_in(select(model.id))))
+            self.counts['stale_counters_removed'] += result.rowcount
+        self._commit()
+
+    def _commit(self):
+        if self.dry_run:
+            db.session.rollback()
+        else:
+            db.session.commit()
+        db.session.expunge_all()
+
+    def run(self):
+        self.logger.info(f"Starting tiering run (dry_run={self.dry_run}, workers={self.workers})")
+        started = time.time()
+        self._now = datetime.utcnow()
+        self.counts = Counter()
+        self._report_file = open(self.report_path, 'a') if self.report_path else None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                self._pdf_pass(pool)
+                self._attachment_pass(pool)
+                self._chunk_pass(pool)
+            self._remove_stale_counters()
+        finally:
+            if self._report_file is not None:
+                self._report_file.close()
+        summary = dict(self.counts, elapsed_seconds=round(time.time() - started, 2))
+        self.logger.info(f"Finished tiering run: {summary}")
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Adjust replication and storage tier of documents by access.')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='Only log and report decisions')
+    parser.add_argument('--report', default=None, help='Append decisions as JSON lines to this file')
+    parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                        help='Run every SECONDS seconds instead of once')
+    args = parser.parse_args(argv)
+
+    with app.app_context():
+        policy = TieringPolicy(workers=args.workers, batch_size=args.batch_size, dry_run=args.dry_run,
+                               report_path=args.report)
+        while True:
+            summary = policy.run()
+            print(json.dumps(summary, indent=2))
+            if not args.loop:
+                break
+            time.sleep(args.loop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import contextvars
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from sqlalchemy import delete, update
+
+from . import db, file_manager
+from .config import Config
+from .file_systems.chunking import iter_chunks
+from .models.versions import DocumentVersion, Chunk
+
+# Shared by chunk writes and read-ahead; storage calls are I/O bound so threads overlap well.
+_io_pool = ThreadPoolExecutor(max_workers=Config.CHUNK_IO_WORKERS, thread_name_prefix='chunk-io')
+_IN_BATCH = 500
+
+
+def chunk_path(chunk_hash):
+    return f"{Config.CHUNK_DIRECTORY}/{chunk_hash[:2]}/{chunk_hash[2:4]}/{chunk_hash}"
+
+
+def _submit(fn, *args):
+    # Run in a copy of the caller's context so per-request state (e.g. an active profile) follows the call.
+    return _io_pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _map(fn, items):
+    return [future.result() for future in [_submit(fn, item) for item in items]]
+
+
+def _batched(items, size=_IN_BATCH):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _insert_missing_chunks(rows):
+    """Insert chunk rows (ref_count 0) that do not exist yet; return the hashes inserted."""
+    dialect = db.session.get_bind(mapper=Chunk).dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    inserted = set()
+    for batch in _batched(rows):
+        inserted.update(h for (h,) in db.session.execute(
+            insert(Chunk).values(batch).on_conflict_do_nothing(index_elements=['hash']).returning(Chunk.hash)))
+    return inserted
+
+
+def _reference_chunks(chunks):
+    """
+    Add one reference to each chunk, creating missing rows.
+    The row locks taken here keep delete_chunks() away from these chunks until the caller commits.
+    :return: (hashes whose count went from 0 to 1, hashes whose row this call created on its first attempt)
+    """
+    revived = set()
+    created = None
+    remaining = dict(chunks)
+    while remaining:
+        inserted = _insert_missing_chunks([{'hash': h, 'size': len(c), 'ref_count': 0} for h, c in remaining.items()])
+        created = inserted if created is None else created
+        for batch in _batched(remaining):
+            statement = (update(Chunk).where(Chunk.hash.in_(batch)).values(ref_count=Chunk.ref_count + 1)
+                         .returning(Chunk.hash, Chunk.ref_count))
+            for chunk_hash, ref_count in db.session.execute(statement):
+                del remaining[chunk_hash]
+                if ref_count == 1:
+                    revived.add(chunk_hash)
+        # Anything left was garbage collected between the insert and the update: insert it again.
+    return revived, created or set()
+
+
+class PreparedVersion:
+    """A file split into chunks, with the chunks the store did not hold already written."""
+
+    def __init__(self, manifest, chunks, size, unknown):
+        self.manifest = manifest  # ordered chunk hashes
+        self.chunks = chunks      # hash -> bytes
+        self.size = size
+        self.unknown = unknown    # hashes without a chunk row when prepared (all written by prepare_version())
+        self.unverified = []      # set by create_version(), see verify_chunks()
+
+
+def prepare_version(local_path, end_transaction=True):
+    """
+    Chunk a local file and write the chunks the store does not already hold (in parallel).
+    This is the slow part of storing a version, so it runs before any lock is taken.
+    :param end_transaction: End the read transaction of the chunk lookup before writing chunks;
+        the session must have no pending changes
+    :return: A PreparedVersion for create_version()
+    """
+    with open(local_path, 'rb') as f:
+        data = f.read()
+    manifest = []
+    chunks = {}
+    for chunk_hash, chunk in iter_chunks(data, Config.CHUNK_MIN_SIZE, Config.CHUNK_AVG_SIZE, Config.CHUNK_MAX_SIZE):
+        manifest.append(chunk_hash)
+        chunks.setdefault(chunk_hash, chunk)
+
+    ref_counts = {}
+    for batch in _batched(chunks):
+        ref_counts.update(db.session.query(Chunk.hash, Chunk.ref_count).filter(Chunk.hash.in_(batch)))
+    if end_transaction:
+        db.session.rollback()
+    # Chunks awaiting garbage collection (ref_count 0) are written again, their file may be going.
+    new = [h for h in chunks if ref_counts.get(h, 0) <= 0]
+    _map(lambda h: file_manager.write_bytes(chunk_path(h), chunks[h]), new)
+    return PreparedVersion(manifest, chunks, len(data), {h for h in chunks if h not in ref_counts})
+
+
+def create_version(pdf, prepared, checksum):
+    """
+    Record a PreparedVersion as the new version of pdf.
+    The version row, chunk rows and reference counts are added to the session, the caller commits
+    and then calls verify_chunks(prepared).
+    :return: The new DocumentVersion
+    """
+    revived, created = _reference_chunks(prepared.chunks)
+    # A chunk only loses its file to a garbage collection that deleted its row. That cannot have happened
+    # to a chunk that had no row when prepared and whose row we created now; every other chunk that was
+    # unreferenced on the way here may have been collected, and is checked once the locks are released.
+    prepared.unverified = sorted(revived - (created & prepared.unknown))
+
+    version = DocumentVersion(
+        version=(pdf.current_version or 0) + 1,
+        size=prepared.size,
+        checksum=checksum,
+        chunks=prepared.manifest
+    )
+    pdf.versions.append(version)
+    pdf.current_version = version.version
+    pdf.checksum = checksum
+    return version
+
+
+def verify_chunks(prepared):
+    """
+    Rewrite chunks of a recorded version that a concurrent garbage collection deleted.
+    Call after create_version() has committed, outside any lock: the committed references keep
+    delete_chunks() away from the chunks, so a file present now stays.
+    :return: Hashes rewritten
+    """
+    hashes = prepared.unverified
+    missing = [h for h, exists in zip(hashes, _map(lambda h: file_manager.exists(chunk_path(h)), hashes)) if not exists]
+    _map(lambda h: file_manager.write_bytes(chunk_path(h), prepared.chunks[h]), missing)
+    prepared.unverified = []
+    return missing
+
+
+def release_versions(versions):
+    """
+    Delete versions and drop their chunk references.
+    :return: Hashes of chunks no longer referenced; pass them to delete_chunks() after committing
+    """
+    references = Counter()
+    for version in list(versions):
+        references.update(set(version.chunks))
+        if version.pdf is not None:
+            version.pdf.versions.remove(version)
+        db.session.delete(version)
+    if not references:
+        return []
+    by_count = defaultdict(list)
+    for chunk_hash, count in references.items():
+        by_count[count].append(chunk_hash)
+    for count, hashes in by_count.items():
+        for batch in _batched(hashes):
+            db.session.execute(update(Chunk).where(Chunk.hash.in_(batch)).values(ref_count=Chunk.ref_count - count))
+    garbage = []
+    for batch in _batched(references):
+        garbage.extend(h for (h,) in db.session.query(Chunk.hash).filter(Chunk.hash.in_(batch), Chunk.ref_count <= 0))
+    return garbage
+
+
+def delete_chunks(hashes):
+    """
+    Garbage collect chunks left unreferenced by a committed release_versions(), in a transaction of its own.
+    Rows are deleted first, only while still unreferenced, and their files are deleted before that
+    commits: an upload referencing one of these chunks meanwhile either locked the row first (and the
+    chunk is kept) or waits for this commit and then writes the file again.
+    """
+    deleted = []
+    try:
+        for batch in _batched(hashes):
+            deleted.extend(h for (h,) in db.session.execute(
+                delete(Chunk).where(Chunk.hash.in_(batch), Chunk.ref_count <= 0).returning(Chunk.hash)))
+        _map(lambda h: file_manager.delete_directory(chunk_path(h)), deleted)
+        db.session.commit()
+    except Exception:
+        # Rows stay with ref_count 0; the next upload of such a chunk rewrites a missing file.
+        db.session.rollback()
+        raise
+    return deleted
+
+
+def prune_versions(pdf):
+    """
+    Release the oldest unpinned versions beyond MAX_UNPINNED_VERSIONS; the current version is always kept.
+    :return: Hashes of chunks no longer referenced
+    """
+    if Config.MAX_UNPINNED_VERSIONS <= 0:
+        return []
+    unpinned = [v for v in pdf.versions if not v.pinned]
+    excess = [v for v in unpinned[:-Config.MAX_UNPINNED_VERSIONS] if v.version != pdf.current_version]
+    return release_versions(excess)
+
+
+def get_version(pdf, number=None):
+    """Return version `number` of pdf (the current one by default), or None."""
+    number = pdf.current_version if number is None else number
+    if number is None:
+        return None
+    return DocumentVersion.query.filter_by(pdf_id=pdf.id, version=number).first()
+
+
+def stream_version(version):
+    """Reassemble a version as a generator of chunk bytes, reading up to CHUNK_IO_WORKERS chunks ahead."""
+    hashes = list(version.chunks)
+
+    def generate():
+        pending = iter(hashes)
+        window = deque(_submit(file_manager.read_bytes, chunk_path(h))
+                       for h in islice(pending, Config.CHUNK_IO_WORKERS))
+        try:
+            while window:
+                data = window.popleft().result()
+                for chunk_hash in islice(pending, 1):
+                    window.append(_submit(file_manager.read_bytes, chunk_path(chunk_hash)))
+                yield data
+        finally:
+            for future in window:
+                future.cancel()
+
+    return generate()
+
+
+def write_version(version, local_path):
+    """Reassemble a version into a local file."""
+    with open(local_path, 'wb') as f:
+        for data in stream_version(version):
+            f.write(data)
@@ -0,0 +1,685 @@
+"""
+Write-behind staging tier for remote storage backends.
+
+Writes are persisted to a local journal and acknowledged as soon as they are on local disk.
+Each write is a data file plus a small record, both fsynced. A background uploader then
+replays the journal against the remote backend (HDFS or S3) in order:
+
+- consecutive puts are uploaded in parallel batches;
+- directory creates, renames and deletes act as barriers;
+- failures are retried with exponential backoff;
+- a record that still fails after max_attempts while the remote answers (a bad path, a permission
+  error, a rejected object) is moved to the dead-letter directory, so it cannot block the records
+  behind it. Dead-lettered records are listed by dead_letters(); while the remote is unreachable
+  nothing is dead-lettered.
+
+Until a path has been replicated it is read from its local copy. When more than
+max_pending_bytes or max_pending_entries are waiting, writers are held back and, after
+backpressure_timeout, rejected with Overloaded. Records left behind by a crash are replayed on
+start-up.
+
+A journal directory is owned by one process at a time, enforced with a lock file: the first
+process to start (normally the server) stages and replicates. Any other process that imports the
+app (CLI tools, a second worker) gets a read-only view: it reads staged files from the journal,
+writes straight to the remote backend, and refuses writes to paths that still have pending
+journal records. A view takes over the journal once its owner has exited.
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from .admission import Overloaded
+from .file_systems.logger import AppLogger
+
+# Set by the app when write-behind is enabled; see replication_state()
+write_behind = None
+
+_BARRIERS = ('mkdir', 'rename', 'delete')
+
+
+def _fsync_directory(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _under(path, prefix):
+    prefix = prefix.rstrip('/')
+    return path == prefix or path.startswith(prefix + '/')
+
+
+def _self_and_parents(path):
+    """path and the directories above it, nearest first."""
+    path = path.rstrip('/')
+    yield path
+    while '/' in path:
+        path = path.rsplit('/', 1)[0]
+        yield path
+
+
+class WriteBehindFileManager:
+    def __init__(self, remote, journal_dir, batch_size=32, workers=4, max_pending_bytes=2 * 1024 ** 3,
+                 max_pending_entries=100_000, backpressure_timeout=10, retry_max_seconds=60, retry_after=5,
+                 max_attempts=10, probe_path=None):
+        """
+        Stage writes for a remote file manager in a local journal.
+        :param remote: File manager the journal is replicated to
+        :param journal_dir: Local directory holding journal records and staged data
+        :param batch_size: Maximum number of puts replicated in parallel
+        :param workers: Threads uploading a batch
+        :param max_pending_bytes: Staged bytes above which writers are held back
+        :param max_pending_entries: Journal records above which writers are held back
+        :param backpressure_timeout: Seconds a held-back writer waits before it is rejected
+        :param retry_max_seconds: Upper bound of the backoff between failed replication attempts
+        :param retry_after: Seconds suggested to rejected callers
+        :param max_attempts: Failed attempts after which a record is dead-lettered, if the remote answers
+        :param probe_path: Remote path whose exists() tells whether the remote answers (default: the record's path)
+        """
+        self.remote = remote
+        self.journal_dir = journal_dir
+        self.data_dir = os.path.join(journal_dir, 'data')
+        self.dead_dir = os.path.join(journal_dir, 'dead')
+        self.batch_size = batch_size
+        self.max_pending_bytes = max_pending_bytes
+        self.max_pending_entries = max_pending_entries
+        self.backpressure_timeout = backpressure_timeout
+        self.retry_max_seconds = retry_max_seconds
+        self.retry_after = retry_after
+        self.max_attempts = max_attempts
+        self.probe_path = probe_path
+        self.logger = AppLogger(name='WriteBehind', prefix=" | WRITE_BEHIND | ").get_logger()
+        os.makedirs(self.data_dir, exist_ok=True)
+        os.makedirs(self.dead_dir, exist_ok=True)
+        self._lock_file = open(os.path.join(journal_dir, '.lock'), 'w')
+        self._workers = workers
+        self._cond = threading.Condition()
+        self._append_lock = threading.Lock()
+        self._owner_lock = threading.Lock()
+        self._failures_in_a_row = 0
+        self._retry_at = 0.0
+        self.replicated = 0
+        self.failures = 0
+        self.rejected = 0
+        self.dead_lettered = 0
+        self.last_error = None
+        self.owner = False
+        self._view_version = None   # journal directory mtime the read-only view was loaded at
+        self._reset()
+        if not self._take_ownership():
+            self.logger.warning(f"Journal '{journal_dir}' is owned by another process; using it read-only, "
+                                f"writes go straight to remote storage")
+            self._sync()
+
+    def _reset(self):
+        self._entries = []          # journal records not yet replicated, in journal order
+        self._staged = {}           # storage path -> data file holding its latest unreplicated content
+        self._tree = defaultdict(Counter)  # directory -> child name -> staged paths below it through that child
+        self._refs = Counter()      # data file -> number of staged paths pointing at it
+        self._unreplicated = set()  # data files whose put has not been replicated yet
+        self._tombstones = {}       # seq -> path of a delete not yet replicated
+        self._deleted = Counter()   # path of a delete not yet replicated -> number of such deletes
+        self._moves = {}            # seq -> (src, dst) of a rename not yet replicated
+        self._move_ends = Counter() # src and dst paths of renames not yet replicated
+        self._attempts = Counter()  # seq -> failed replication attempts
+        self._pending_bytes = 0
+        self._seq = 0
+
+    def _take_ownership(self):
+        """Lock the journal for this process and start replicating it; False if another process holds it."""
+        with self._owner_lock:
+            if self.owner:
+                return True
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            with self._cond:
+                self._reset()
+                self._replay()
+                self.owner = True
+            self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='write-behind')
+            self._thread = threading.Thread(target=self._run, name='write-behind-uploader', daemon=True)
+            self._thread.start()
+            return True
+
+    def _sync(self):
+        """In a process that does not own the journal, take it over if its owner has exited, else
+        reload the read-only view when the journal directory has changed."""
+        if self.owner or self._take_ownership():
+            return
+        version = os.stat(self.journal_dir).st_mtime_ns
+        if version == self._view_version:
+            return
+        records = []
+        for entry in sorted(os.listdir(self.journal_dir)):
+            if entry.endswith('.json'):
+                try:
+                    with open(os.path.join(self.journal_dir, entry)) as f:
+                        records.append(json.load(f))
+                except FileNotFoundError:
+                    pass  # replicated by the owner meanwhile
+        with self._cond:
+            self._reset()
+            for record in records:
+                self._add(record)
+            self._view_version = version
+
+    # Journal
+
+    def _record_path(self, seq):
+        return os.path.join(self.journal_dir, f"{seq:020d}.json")
+
+    def _replay(self):
+        records = []
+        for entry in sorted(os.listdir(self.journal_dir)):
+            if entry.endswith('.json'):
+                with open(os.path.join(self.journal_dir, entry)) as f:
+                    records.append(json.load(f))
+            elif entry.endswith('.tmp'):
+                os.remove(os.path.join(self.journal_dir, entry))
+        referenced = {record['data'] for record in records if record.get('data')}
+        # Data written by a put whose record never made it to disk was not acknowledged.
+        for entry in os.listdir(self.data_dir):
+            if entry not in referenced:
+                os.remove(os.path.join(self.data_dir, entry))
+        for record in records:
+            self._add(record)
+        self._seq = records[-1]['seq'] if records else 0
+        if records:
+            self.logger.info(f"Replaying {len(records)} journal records ({self._pending_bytes} bytes) after restart")
+
+    def _append(self, record, data=None, local_path=None):
+        size = len(data) if data is not None else os.path.getsize(local_path) if local_path is not None else 0
+        with self._cond:
+            admitted = self._cond.wait_for(
+                lambda: not self._entries or (self._pending_bytes + size <= self.max_pending_bytes
+                                              and len(self._entries) < self.max_pending_entries),
+                timeout=self.backpressure_timeout)
+            if not admitted:
+                self.rejected += 1
+                raise Overloaded('write_behind', self.retry_after)
+
+        if data is not None or local_path is not None:
+            record['data'] = uuid.uuid4().hex
+            record['size'] = size
+            data_path = os.path.join(self.data_dir, record['data'])
+            if data is not None:
+                with open(data_path, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                shutil.copyfile(local_path, data_path)
+                with open(data_path, 'rb') as f:
+                    os.fsync(f.fileno())
+            _fsync_directory(self.data_dir)
+
+        # Records are numbered and written under one lock so journal order is acknowledgement order.
+        with self._append_lock:
+            self._seq += 1
+            record['seq'] = self._seq
+            record['created_at'] = time.time()
+            tmp_path = f"{self._record_path(record['seq'])}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(record, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._record_path(record['seq']))
+            _fsync_directory(self.journal_dir)
+            with self._cond:
+                self._add(record)
+                self._cond.notify_all()
+
+    def _add(self, record):
+        """Apply a record to the in-memory view of staged paths; caller holds self._cond (or is replaying)."""
+        op = record['op']
+        if op == 'put':
+            self._unstage(record['path'])
+            self._stage(record['path'], record['data'])
+            self._refs[record['data']] += 1
+            self._unreplicated.add(record['data'])
+            self._pending_bytes += record['size']
+        elif op == 'rename':
+            for path in self._staged_under(record['src']):
+                target = record['dst'].rstrip('/') + path[len(record['src'].rstrip('/')):]
+                self._unstage(target)
+                data = self._staged.pop(path)
+                self._index(path, -1)
+                self._stage(target, data)
+            self._moves[record['seq']] = (record['src'], record['dst'])
+            self._move_ends.update((record['src'].rstrip('/'), record['dst'].rstrip('/')))
+        elif op == 'delete':
+            for path in self._staged_under(record['path']):
+                self._unstage(path)
+            self._tombstones[record['seq']] = record['path']
+            self._deleted[record['path'].rstrip('/')] += 1
+        self._entries.append(record)
+
+    def _index(self, path, delta):
+        """Count path in the directory tree of staged paths (delta 1) or remove it (delta -1)."""
+        path = path.rstrip('/')
+        while '/' in path:
+            parent, name = path.rsplit('/', 1)
+            children = self._tree[parent]
+            children[name] += delta
+            if children[name] <= 0:
+                del children[name]
+                if not children:
+                    del self._tree[parent]
+            path = parent
+
+    def _stage(self, path, data):
+        self._staged[path] = data
+        self._index(path, 1)
+
+    def _staged_under(self, path):
+        """Staged paths equal to or below path; caller holds self._cond."""
+        path = path.rstrip('/')
+        found = [path] if path in self._staged else []
+        directories = [path]
+        while directories:
+            directory = directories.pop()
+            for name in self._tree.get(directory, ()):
+                child = f"{directory}/{name}"
+                if child in self._staged:
+                    found.append(child)
+                if child in self._tree:
+                    directories.append(child)
+        return found
+
+    def _is_deleted(self, path):
+        """True if a delete not replicated yet covers path; caller holds self._cond."""
+        return bool(self._deleted) and any(p in self._deleted for p in _self_and_parents(path))
+
+    def _uncount(self, counter, key):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def _unstage(self, path):
+        data = self._staged.pop(path, None)
+        if data is None:
+            return
+        self._index(path, -1)
+        self._refs[data] -= 1
+        if self._refs[data] <= 0:
+            del self._refs[data]
+            if data not in self._unreplicated:
+                self._remove_data(data)
+
+    def _remove_data(self, data):
+        try:
+            os.remove(os.path.join(self.data_dir, data))
+        except FileNotFoundError:
+            pass
+
+    def _done(self, record):
+        """Forget a replicated record; caller holds self._cond."""
+        self._retire(record)
+        self.replicated += 1
+
+    def _dead_letter(self, record, error):
+        """Move a record that keeps failing (and its data) to the dead-letter directory; caller holds self._cond."""
+        entry = dict(record, error=f"{type(error).__name__}: {error}", attempts=self._attempts[record['seq']],
+                     dead_at=time.time())
+        if record.get('data'):
+            shutil.copyfile(os.path.join(self.data_dir, record['data']), os.path.join(self.dead_dir, record['data']))
+        path = os.path.join(self.dead_dir, os.path.basename(self._record_path(record['seq'])))
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(entry, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        _fsync_directory(self.dead_dir)
+        self._retire(record)
+        self.dead_lettered += 1
+        self.logger.error(f"Dead-lettered {record['op']} {record.get('path') or record.get('src')} after "
+                          f"{entry['attempts']} attempts: {entry['error']}")
+
+    def _retire(self, record):
+        """Remove a replicated or dead-lettered record from the view and the journal; caller holds self._cond."""
+        self._attempts.pop(record['seq'], None)
+        op = record['op']
+        if op == 'put':
+            self._unreplicated.discard(record['data'])
+            self._pending_bytes -= record['size']
+            if self._staged.get(record['path']) == record['data']:
+                self._unstage(record['path'])
+            elif record['data'] not in self._refs:
+                self._remove_data(record['data'])
+        elif op == 'rename':
+            # The remote now has the renamed files, unless a later put replaced them locally.
+            for path in self._staged_under(record['dst']):
+                if self._staged[path] not in self._unreplicated:
+                    self._unstage(path)
+            if self._moves.pop(record['seq'], None) is not None:
+                self._uncount(self._move_ends, record['src'].rstrip('/'))
+                self._uncount(self._move_ends, record['dst'].rstrip('/'))
+        elif op == 'delete':
+            if self._tombstones.pop(record['seq'], None) is not None:
+                self._uncount(self._deleted, record['path'].rstrip('/'))
+        self._entries.remove(record)
+        os.remove(self._record_path(record['seq']))
+
+    # Uploader
+
+    def _next_batch(self):
+        first = self._entries[0]
+        if first['op'] in _BARRIERS:
+            return [first]
+        batch, paths = [], set()
+        for record in self._entries[:self.batch_size]:
+            if record['op'] in _BARRIERS or record['path'] in paths:
+                break
+            batch.append(record)
+            paths.add(record['path'])
+        return batch
+
+    def _replicate(self, record):
+        op = record['op']
+        if op == 'put':
+            self.remote.upload_file(local_path=os.path.join(self.data_dir, record['data']),
+                                    storage_path=record['path'], overwrite=True)
+        elif op == 'mkdir':
+            self.remote.create_directory(record['path'])
+        elif op == 'delete':
+            self.remote.delete_directory(record['path'])
+        elif op == 'rename':
+            # A replayed rename may already have been applied before the crash.
+            if self.remote.exists(record['src']) or not self.remote.exists(record['dst']):
+                self.remote.rename(record['src'], record['dst'])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._entries or time.monotonic() < self._retry_at:
+                    self._cond.wait(timeout=max(self._retry_at - time.monotonic(), 0) if self._entries else None)
+                batch = self._next_batch()
+            futures = [(record, self._pool.submit(self._replicate, record)) for record in batch]
+            outcomes = []
+            for record, future in futures:
+                try:
+                    future.result()
+                    outcomes.append((record, None))
+                except Exception as e:
+                    outcomes.append((record, e))
+            errors = [(record, error) for record, error in outcomes if error is not None]
+            for record, error in errors:
+                if not isinstance(error, Overloaded):  # no free storage slot: not the record's fault
+                    self._attempts[record['seq']] += 1
+            exhausted = [(record, error) for record, error in errors if self._attempts[record['seq']] >= self.max_attempts]
+            dead = exhausted if exhausted and self._remote_answers(exhausted[0][0]) else []
+            if exhausted and not dead:
+                for record, _ in exhausted:
+                    self._attempts[record['seq']] = 0  # failures during an outage do not count
+            dead_seqs = {record['seq'] for record, _ in dead}
+            errors = [(record, error) for record, error in errors if record['seq'] not in dead_seqs]
+            with self._cond:
+                for record, error in outcomes:
+                    if error is None:
+                        self._done(record)
+                for record, error in dead:
+                    self._dead_letter(record, error)
+                self.failures += len(dead)
+                if errors:
+                    self.failures += len(errors)
+                    self._failures_in_a_row += 1
+                    delay = min(2 ** (self._failures_in_a_row - 1), self.retry_max_seconds)
+                    self._retry_at = time.monotonic() + delay
+                    record, error = errors[0]
+                    self.last_error = f"{record['op']} {record.get('path') or record.get('src')}: {error}"
+                    self.logger.error(f"Replication failed for {len(errors)} records, retrying in {delay}s: "
+                                      f"{self.last_error}")
+                else:
+                    self._failures_in_a_row = 0
+                self._cond.notify_all()
+
+    def _remote_answers(self, record):
+        """True if the remote responds, so a record that keeps failing is at fault rather than the remote."""
+        try:
+            self.remote.exists(self.probe_path or record.get('path') or record['src'])
+            return True
+        except Exception as e:
+            self.logger.warning(f"Remote storage does not answer, not dead-lettering: {e}")
+            return False
+
+    def flush(self, timeout=None):
+        """Wait until every journal record has been replicated; returns False on timeout."""
+        if not self.owner:
+            raise RuntimeError("Only the process owning the journal can flush it")
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._entries, timeout=timeout)
+
+    # Replication state
+
+    def pending(self, paths):
+        """The paths whose latest content is still only in the local journal."""
+        self._sync()
+        with self._cond:
+            return [path for path in paths if path in self._staged]
+
+    def stats(self):
+        self._sync()
+        with self._cond:
+            return {
+                'owner': self.owner,
+                'pending_entries': len(self._entries),
+                'pending_bytes': self._pending_bytes,
+                'staged_paths': len(self._staged),
+                'oldest_pending_seconds': round(time.time() - self._entries[0]['created_at'], 3)
+                if self._entries else 0,
+                'replicated': self.replicated,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'dead_letter_entries': sum(1 for entry in os.listdir(self.dead_dir) if entry.endswith('.json')),
+                'last_error': self.last_error
+            }
+
+    def dead_letters(self):
+        """Dead-lettered records, oldest first. Each keeps its data (if any) next to it in the dead-letter
+        directory under its 'data' name; replay it by hand and delete both files."""
+        records = []
+        for entry in sorted(os.listdir(self.dead_dir)):
+            if entry.endswith('.json'):
+                with open(os.path.join(self.dead_dir, entry)) as f:
+                    records.append(json.load(f))
+        return records
+
+    def _pending_for(self, path):
+        """Journal records not yet replicated that touch path, a path below it or one of its parents;
+        caller holds self._cond."""
+        return [record for record in self._entries
+                if any(_under(p, path) or _under(path, p)
+                       for p in (record.get('path'), record.get('src'), record.get('dst')) if p)]
+
+    def _journaling(self, *paths):
+        """True if writes are journaled in this process. Otherwise they go straight to the remote,
+        which is refused while the owner still has records for the paths: they would be replayed after."""
+        self._sync()
+        if self.owner:
+            return True
+        with self._cond:
+            busy = [path for path in paths if self._pending_for(path)]
+        if busy:
+            self.rejected += 1
+            self.logger.warning(f"Not writing {busy[0]} directly: the journal owner has pending records for it")
+            raise Overloaded('write_behind', self.retry_after)
+        return False
+
+    # File manager interface
+
+    def _local_copy(self, path):
+        self._sync()
+        with self._cond:
+            data = self._staged.get(path)
+            if data is None:
+                if self._is_deleted(path):
+                    raise FileNotFoundError(f"{path} has been deleted")
+                return None
+            return os.path.join(self.data_dir, data)
+
+    def _remote_path(self, path):
+        """Where path currently is on the remote, following renames that are not replicated yet."""
+        with self._cond:
+            if not any(p in self._move_ends for p in _self_and_parents(path)):
+                return path
+            for src, dst in reversed(list(self._moves.values())):
+                if _under(path, dst):
+                    path = src.rstrip('/') + path[len(dst.rstrip('/')):]
+            return path
+
+    def _read_local(self, path, read):
+        local_path = self._local_copy(path)
+        if local_path is not None:
+            try:
+                return read(local_path)
+            except FileNotFoundError:
+                pass  # replicated (and cleaned up) since the lookup
+        return None
+
+    def write_bytes(self, storage_path, data, overwrite=True):
+        if not self._journaling(storage_path):
+            return self.remote.write_bytes(storage_path, data, overwrite=overwrite)
+        self._append({'op': 'put', 'path': storage_path}, data=data)
+
+    def upload_file(self, local_path, storage_path, overwrite=True):
+        if not self._journaling(storage_path):
+            return self.remote.upload_file(local_path=local_path, storage_path=storage_path, overwrite=overwrite)
+        self._append({'op': 'put', 'path': storage_path}, local_path=local_path)
+
+    def create_directory(self, path):
+        if not self._journaling(path):
+            return self.remote.create_directory(path)
+        self._append({'op': 'mkdir', 'path': path})
+
+    def delete_directory(self, path, recursive=True):
+        if not self._journaling(path):
+            return self.remote.delete_directory(path, recursive=recursive)
+        self._append({'op': 'delete', 'path': path})
+
+    def rename(self, old_path, new_path):
+        if not self._journaling(old_path, new_path):
+            return self.remote.rename(old_path, new_path)
+        # A direct rename would overtake pending records for these paths (e.g. the mkdir of the
+        # destination's parent, or a delete of the destination), so it is journaled behind them.
+        with self._cond:
+            pending = self._pending_for(old_path) or self._pending_for(new_path)
+        if not pending:
+            return self.remote.rename(old_path, new_path)
+        self._append({'op': 'rename', 'src': old_path, 'dst': new_path})
+
+    def read_bytes(self, storage_path):
+        def read(local_path):
+            with open(local_path, 'rb') as f:
+                return f.read()
+        content = self._read_local(storage_path, read)
+        return content if content is not None else self.remote.read_bytes(self._remote_path(storage_path))
+
+    def read_file(self, storage_path, encoding='utf-8'):
+        def read(local_path):
+            with open(local_path, encoding=encoding) as f:
+                return f.read()
+        content = self._read_local(storage_path, read)
+        return content if content is not None else self.remote.read_file(self._remote_path(storage_path),
+                                                                          encoding=encoding)
+
+    def download_file(self, src_path, local_path, overwrite=True):
+        if self._read_local(src_path, lambda staged_path: shutil.copyfile(staged_path, local_path)) is None:
+            self.remote.download_file(src_path=self._remote_path(src_path), local_path=local_path)
+
+    def exists(self, path):
+        self._sync()
+        with self._cond:
+            if path in self._staged or path.rstrip('/') in self._tree:
+                return True
+            if self._is_deleted(path):
+                return False
+            if (any(p in self._move_ends for p in _self_and_parents(path))
+                    and any(_under(path, src) and not _under(path, dst) for src, dst in self._moves.values())):
+                return False  # renamed away, not replicated yet
+        return self.remote.exists(self._remote_path(path))
+
+    def file_status(self, path):
+        local_path = self._local_copy(path)
+        if local_path is not None:
+            return {'type': 'FILE', 'length': os.path.getsize(local_path), 'mtime': os.path.getmtime(local_path)}
+        return self.remote.file_status(self._remote_path(path))
+
+    def list_directory(self, path, status=False):
+        """Remote listing merged with staged paths below `path` and without pending deletes."""
+        self._sync()
+        prefix = path.rstrip('/') + '/'
+        with self._cond:
+            # name -> data file of a staged file, or None for a directory holding staged files
+            staged = {name: self._staged.get(prefix + name) for name in self._tree.get(path.rstrip('/'), ())}
+        try:
+            remote = self.remote.list_directory(path, status=status)
+        except FileNotFoundError:
+            if not staged:
+                raise
+            remote = []
+        listing = {}
+        with self._cond:
+            if not self._is_deleted(path):
+                for item in remote:
+                    name = item[0] if status else item
+                    if prefix + name not in self._deleted:
+                        listing[name] = item
+        for name, data in staged.items():
+            if status:
+                if data is None:
+                    listing.setdefault(name, (name, {'type': 'DIRECTORY', 'length': 0, 'mtime': None}))
+                else:
+                    data_path = os.path.join(self.data_dir, data)
+                    listing[name] = (name, {'type': 'FILE', 'length': os.path.getsize(data_path),
+                                            'mtime': os.path.getmtime(data_path)})
+            else:
+                listing[name] = name
+        return list(listing.values())
+
+    def __getattr__(self, name):
+        # append_to_file, set_replication, ...: not staged, go straight to the remote backend
+        return getattr(self.remote, name)
+
+
+def replication_state(paths):
+    """'pending' while any of the paths is only in the local journal, else 'replicated'."""
+    pending = write_behind.pending(paths) if write_behind is not None else []
+    return {'state': 'pending' if pending else 'replicated', 'pending_files': len(pending)}
+
+
+def write_behind_stats():
+    if write_behind is None:
+        return {'enabled': False}
+    return {'enabled': True, **write_behind.stats()}
+
+
+def write_behind_dead_letters():
+    return write_behind.dead_letters() if write_behind is not None else []
+
+
+def init_write_behind(remote, config):
+    """Wrap `remote` in a write-behind tier configured from `config` and make it the one replication_state() reports."""
+    global write_behind
+    write_behind = WriteBehindFileManager(
+        remote,
+        journal_dir=config.WRITE_BEHIND_DIRECTORY,
+        batch_size=config.WRITE_BEHIND_BATCH_SIZE,
+        workers=config.WRITE_BEHIND_WORKERS,
+        max_pending_bytes=config.WRITE_BEHIND_MAX_PENDING_BYTES,
+        max_pending_entries=config.WRITE_BEHIND_MAX_PENDING_ENTRIES,
+        backpressure_timeout=config.WRITE_BEHIND_BACKPRESSURE_TIMEOUT,
+        retry_max_seconds=config.WRITE_BEHIND_RETRY_MAX_SECONDS,
+        retry_after=config.ADMISSION_RETRY_AFTER,
+        max_attempts=config.WRITE_BEHIND_MAX_ATTEMPTS,
+        probe_path=config.PARENT_DIRECTORY
+    )
+    return write_behind
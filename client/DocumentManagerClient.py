@@ -3,13 +3,15 @@ import requests
 class DocumentManagerClient:
     def __init__(self, base_url):
         self.base_url = base_url
+        # A shared session reuses connections and keeps the server's read-your-writes cookie
+        self.session = requests.Session()
 
     # PDF methods
     def upload_pdf(self, file_path, metadata=None):
         url = f"{self.base_url}/api/pdfs/"
         files = {'file': open(file_path, 'rb')}
         data = {'metadata': metadata} if metadata else {}
-        response = requests.post(url, files=files, data=data)
+        response = self.session.post(url, files=files, data=data)
         files['file'].close()
         response.raise_for_status()
         return response.json()
@@ -22,13 +24,13 @@ class DocumentManagerClient:
         if meta_key and meta_value:
             params['meta_key'] = meta_key
             params['meta_value'] = meta_value
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params)
         response.raise_for_status()
         return response.json()
 
     def download_pdf(self, pdf_id, save_path):
         url = f"{self.base_url}/api/pdfs/download/{pdf_id}"
-        response = requests.get(url, stream=True)
+        response = self.session.get(url, stream=True)
         response.raise_for_status()
         with open(save_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
@@ -36,22 +38,35 @@ class DocumentManagerClient:
 
     def get_pdf(self, pdf_id):
         url = f"{self.base_url}/api/pdfs/{pdf_id}"
-        response = requests.get(url)
+        response = self.session.get(url)
         response.raise_for_status()
         return response.json()
 
     def delete_pdf(self, pdf_id):
         url = f"{self.base_url}/api/pdfs/{pdf_id}"
-        response = requests.delete(url)
+        response = self.session.delete(url)
         response.raise_for_status()
         return response.json()
 
+    def get_many(self, ids, entity='pdfs', batch_size=500):
+        """Fetch metadata for many PDFs (with their attachments) or attachments in batch requests.
+        Returns {id: document}, with None for ids that do not exist."""
+        url = f"{self.base_url}/api/{entity}/batch"
+        ids = list(ids)
+        documents = {}
+        for start in range(0, len(ids), batch_size):
+            response = self.session.post(url, json={'ids': ids[start:start + batch_size]})
+            response.raise_for_status()
+            for key, document in response.json()['results'].items():
+                documents[int(key)] = None if 'error' in document else document
+        return documents
+
     # Attachment methods
     def upload_attachment(self, pdf_id, file_path, metadata=None):
         url = f"{self.base_url}/api/attachments/{pdf_id}"
         files = {'file': open(file_path, 'rb')}
         data = {'metadata': metadata} if metadata else {}
-        response = requests.post(url, files=files, data=data)
+        response = self.session.post(url, files=files, data=data)
         files['file'].close()
         response.raise_for_status()
         return response.json()
@@ -64,13 +79,13 @@ class DocumentManagerClient:
         if meta_key and meta_value:
             params['meta_key'] = meta_key
             params['meta_value'] = meta_value
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params)
         response.raise_for_status()
         return response.json()
 
     def download_attachment(self, attachment_id, save_path):
         url = f"{self.base_url}/api/attachments/download/{attachment_id}"
-        response = requests.get(url, stream=True)
+        response = self.session.get(url, stream=True)
         response.raise_for_status()
         with open(save_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
@@ -78,13 +93,25 @@ class DocumentManagerClient:
 
     def get_attachment(self, attachment_id):
         url = f"{self.base_url}/api/attachments/{attachment_id}"
-        response = requests.get(url)
+        response = self.session.get(url)
         response.raise_for_status()
         return response.json()
 
     def delete_attachment(self, attachment_id):
         url = f"{self.base_url}/api/attachments/{attachment_id}"
-        response = requests.delete(url)
+        response = self.session.delete(url)
+        response.raise_for_status()
+        return response.json()
+
+    # Change feed methods
+    def get_changes(self, after=0, limit=None, wait=None):
+        url = f"{self.base_url}/api/changes"
+        params = {'after': after}
+        if limit:
+            params['limit'] = limit
+        if wait:
+            params['wait'] = wait
+        response = self.session.get(url, params=params)
         response.raise_for_status()
         return response.json()
 
@@ -0,0 +1,28 @@
+"""
+The application is built when `app` is first imported, from the environment, so the environment is
+set here before any test module imports it: local storage with the upload, chunk and temporary
+directories in a scratch directory, a SQLite primary and a SQLite read replica. The application
+resolves its static and log directories against the working directory, so tests run from the
+repository root.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIRECTORY = tempfile.mkdtemp(prefix='document-manager-tests-')
+
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.update({
+    'FILE_SYSTEM': 'local',
+    'DATABASE_URL': f"sqlite:///{WORK_DIRECTORY}/primary.db",
+    'DATABASE_REPLICA_URLS': f"sqlite:///{WORK_DIRECTORY}/replica.db",
+    'DATABASE_STICKY_SECONDS': '5',
+    'PARENT_DIRECTORY': os.path.join(WORK_DIRECTORY, 'uploads'),
+    'CHUNK_DIRECTORY': os.path.join(WORK_DIRECTORY, 'chunks'),
+    'TMP_DIRECTORY': os.path.join(WORK_DIRECTORY, 'tmp'),
+    'ACCESS_FLUSH_SECONDS': '3600',
+    'PROFILING_ENABLED': 'false',
+    'WRITE_BEHIND_ENABLED': 'false',
+})
@@ -0,0 +1,68 @@
+"""Read-replica routing and the read-your-writes cookie, with SQLite files as primary and replica."""
+import io
+
+import pytest
+from sqlalchemy import delete, insert
+
+from app import app, db
+from app.db_routing import STICKY_COOKIE
+from app.models.documents import PDF
+
+
+def _insert_pdf(engine, filename):
+    with engine.begin() as connection:
+        connection.execute(insert(PDF).values(original_filename=filename, name_key=filename,
+                                              stored_path=f"{filename}/{filename}"))
+
+
+@pytest.fixture
+def databases():
+    """Primary and replica hold different rows, so a response shows which one served it."""
+    with app.app_context():
+        primary, replica = db.engines[None], db.engines['replica_0']
+        db.metadata.create_all(replica)
+        for engine in (primary, replica):
+            with engine.begin() as connection:
+                connection.execute(delete(PDF))
+        _insert_pdf(replica, 'replica.pdf')
+        yield primary, replica
+
+
+def _listed(client):
+    response = client.get('/api/pdfs/')
+    assert response.status_code == 200
+    return [pdf['original_filename'] for pdf in response.get_json()]
+
+
+def test_reads_use_the_replica(databases):
+    primary, _ = databases
+    _insert_pdf(primary, 'primary.pdf')
+    client = app.test_client()
+    assert _listed(client) == ['replica.pdf']
+    assert client.get_cookie(STICKY_COOKIE) is None
+
+
+def test_write_pins_the_client_to_the_primary(databases):
+    client = app.test_client()
+    response = client.post('/api/pdfs/', data={'file': (io.BytesIO(b'%PDF-1.7 sticky'), 'sticky.pdf')})
+    assert response.status_code == 201
+    cookie = client.get_cookie(STICKY_COOKIE)
+    assert cookie is not None and cookie.max_age == app.config['DATABASE_STICKY_SECONDS']
+    # The replica has not seen the upload; the writer reads its own write from the primary.
+    assert _listed(client) == ['sticky.pdf']
+    assert _listed(app.test_client()) == ['replica.pdf']
+
+
+def test_failed_write_does_not_pin(databases):
+    client = app.test_client()
+    assert client.post('/api/pdfs/', data={}).status_code == 400
+    assert client.get_cookie(STICKY_COOKIE) is None
+
+
+def test_read_only_post_uses_the_replica(databases):
+    client = app.test_client()
+    replica_id = client.get('/api/pdfs/').get_json()[0]['id']
+    response = client.post('/api/pdfs/batch', json={'ids': [replica_id]})
+    assert response.status_code == 200
+    assert client.get_cookie(STICKY_COOKIE) is None
+    assert 'replica.pdf' in response.get_data(as_text=True)
@@ -0,0 +1,85 @@
+"""S3Manager against moto's in-memory S3: the same contract FileManager and HDFSManager implement."""
+import pytest
+
+moto = pytest.importorskip('moto')
+
+from app.file_systems.s3_client import S3Manager
+
+PART_SIZE = 5 * 1024 * 1024  # S3's minimum multipart part size
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for variable in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SECURITY_TOKEN', 'AWS_SESSION_TOKEN'):
+        monkeypatch.setenv(variable, 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        yield S3Manager(bucket='documents', region='us-east-1', multipart_threshold=PART_SIZE, part_size=PART_SIZE)
+
+
+def test_bytes_round_trip(s3):
+    s3.write_bytes('docs/a.pdf/a.pdf', b'%PDF-1.7 content')
+    assert s3.read_bytes('docs/a.pdf/a.pdf') == b'%PDF-1.7 content'
+    assert s3.read_file('/docs/a.pdf/a.pdf') == '%PDF-1.7 content'
+    s3.append_to_file('docs/a.pdf/a.pdf', ' appended')
+    assert s3.read_file('docs/a.pdf/a.pdf') == '%PDF-1.7 content appended'
+    with pytest.raises(FileExistsError):
+        s3.write_bytes('docs/a.pdf/a.pdf', b'other', overwrite=False)
+
+
+def test_multipart_file_round_trip(s3, tmp_path):
+    data = bytes(range(256)) * (3 * PART_SIZE // 256)
+    (tmp_path / 'large.pdf').write_bytes(data)
+    s3.upload_file(str(tmp_path / 'large.pdf'), 'docs/large.pdf')
+    s3.download_file('docs/large.pdf', str(tmp_path / 'copy.pdf'))
+    assert (tmp_path / 'copy.pdf').read_bytes() == data
+    assert s3.file_status('docs/large.pdf')['size'] == len(data)
+    with pytest.raises(FileExistsError):
+        s3.upload_file(str(tmp_path / 'large.pdf'), 'docs/large.pdf', overwrite=False)
+
+
+def test_list_directory(s3):
+    s3.write_bytes('docs/a.pdf/a.pdf', b'pdf')
+    s3.write_bytes('docs/a.pdf/attachments/x_note.png', b'png')
+    s3.write_bytes('docs/b.pdf/b.pdf', b'pdf')
+    assert sorted(s3.list_directory('docs')) == ['a.pdf', 'b.pdf']
+    assert sorted(s3.list_directory('/docs/a.pdf/')) == ['a.pdf', 'attachments']
+    statuses = dict(s3.list_directory('docs/a.pdf', status=True))
+    assert statuses['a.pdf']['is_file'] and statuses['a.pdf']['size'] == 3
+    assert statuses['attachments']['is_dir']
+    assert s3.file_status('docs/a.pdf')['is_dir']
+
+
+def test_rename_object_and_prefix(s3):
+    s3.write_bytes('docs/a/a.pdf', b'pdf')
+    s3.write_bytes('docs/a/attachments/x.png', b'png')
+    s3.rename('docs/a/a.pdf', 'docs/a.pdf/a.pdf')
+    assert s3.read_bytes('docs/a.pdf/a.pdf') == b'pdf'
+    assert not s3.exists('docs/a/a.pdf')
+    s3.rename('docs/a', 'docs/a.png')
+    assert s3.read_bytes('docs/a.png/attachments/x.png') == b'png'
+    assert not s3.exists('docs/a')
+
+
+def test_delete_directory(s3):
+    s3.write_bytes('docs/a.pdf/a.pdf', b'pdf')
+    s3.write_bytes('docs/a.pdf/attachments/x.png', b'png')
+    s3.write_bytes('docs/a.png/a.png', b'png')
+    with pytest.raises(OSError):
+        s3.delete_directory('docs/a.pdf', recursive=False)
+    s3.delete_directory('docs/a.pdf/attachments/x.png', recursive=False)
+    assert not s3.exists('docs/a.pdf/attachments/x.png')
+    s3.delete_directory('docs/a.pdf')
+    assert not s3.exists('docs/a.pdf')
+    # A sibling sharing the key prefix 'docs/a.p' is not a child of the deleted directory.
+    assert s3.read_bytes('docs/a.png/a.png') == b'png'
+
+
+def test_missing_paths(s3):
+    assert not s3.exists('docs/missing.pdf')
+    assert s3.list_directory('docs/missing') == []
+    with pytest.raises(FileNotFoundError):
+        s3.file_status('docs/missing.pdf')
+    with pytest.raises(FileNotFoundError):
+        s3.rename('docs/missing.pdf', 'docs/other.pdf')
+    s3.delete_directory('docs/missing')  # deleting nothing is not an error